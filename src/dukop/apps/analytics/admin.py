@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from . import models
+
+
+@admin.register(models.DailyTraffic)
+class DailyTrafficAdmin(admin.ModelAdmin):
+    list_display = (
+        "date",
+        "landing_page",
+        "referring_domain",
+        "device_type",
+        "visits",
+        "events",
+    )
+    list_filter = ("device_type",)
+    search_fields = ("landing_page", "referring_domain")
+    date_hierarchy = "date"
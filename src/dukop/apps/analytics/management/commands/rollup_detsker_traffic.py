@@ -0,0 +1,153 @@
+"""
+Rolls up the raw traffic log of the old site (Visits and AhoyEvents) into
+DailyTraffic.
+
+Both tables are streamed in chunks and aggregated on the fly, so only the
+daily counters are held in memory. The rollup replaces all DailyTraffic rows
+when it is done, so running it again gives the same result.
+
+The old tables are models of the sync_old app, which has to be installed
+along with the detsker database.
+"""
+import sys
+import traceback
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from dukop.apps.analytics.models import DailyTraffic
+from dukop.apps.sync_old.utils import df
+from dukop.apps.sync_old.utils import ImportStats
+from dukop.apps.sync_old.utils import iter_chunks
+
+
+def visit_dimensions(landing_page, referring_domain, device_type):
+    """
+    Normalizes the columns of a visit that traffic is grouped by. Landing
+    pages are reduced to their path so query strings don't split the counts.
+    """
+    landing_page = urlsplit(landing_page or "").path or "/"
+    return (
+        landing_page[:255],
+        (referring_domain or "").lower()[:255],
+        (device_type or "")[:64],
+    )
+
+
+def rollup_visits(chunk, visits):
+    for visit in chunk:
+        if not visit.started_at:
+            continue
+        dimensions = visit_dimensions(
+            visit.landing_page, visit.referring_domain, visit.device_type
+        )
+        visits[(df(visit.started_at).date(),) + dimensions] += 1
+
+
+def rollup_events(chunk, events):
+    """
+    Counts a chunk of AhoyEvents by the dimensions of their visits. The visits
+    of the chunk are fetched with a single query.
+    """
+    visit_ids = {event.visit_id for event in chunk if event.visit_id}
+    visits = apps.get_model("sync_old", "Visits").objects.filter(id__in=visit_ids)
+    dimensions_by_visit = {
+        visit_id: visit_dimensions(landing_page, referring_domain, device_type)
+        for visit_id, landing_page, referring_domain, device_type in visits.values_list(
+            "id", "landing_page", "referring_domain", "device_type"
+        )
+    }
+    for event in chunk:
+        if not event.time:
+            continue
+        dimensions = dimensions_by_visit.get(
+            event.visit_id, visit_dimensions(None, None, None)
+        )
+        events[(df(event.time).date(),) + dimensions] += 1
+
+
+class Command(BaseCommand):
+    help = "Roll up the traffic log of the old database into daily counts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of old rows read from the database at a time",
+        )
+        parser.add_argument(
+            "--dry",
+            action="store_true",
+            default=False,
+            help="Dry-run: Count everything but don't write the rollup",
+        )
+
+    def handle(self, *args, **options):
+        if not apps.is_installed("dukop.apps.sync_old"):
+            raise CommandError("The old tables need dukop.apps.sync_old installed")
+        Visits = apps.get_model("sync_old", "Visits")
+        AhoyEvents = apps.get_model("sync_old", "AhoyEvents")
+
+        chunk_size = options["chunk_size"]
+        stats = ImportStats()
+        visits = Counter()
+        events = Counter()
+
+        try:
+            with stats.record_queries():
+                with stats.stage("visits") as stage:
+                    queryset = Visits.objects.only(
+                        "id",
+                        "landing_page",
+                        "referring_domain",
+                        "device_type",
+                        "started_at",
+                    )
+                    for chunk in iter_chunks(queryset, chunk_size):
+                        rollup_visits(chunk, visits)
+                        stage.rows += len(chunk)
+
+                with stats.stage("ahoy_events") as stage:
+                    queryset = AhoyEvents.objects.only("id", "visit_id", "time")
+                    for chunk in iter_chunks(queryset, chunk_size):
+                        rollup_events(chunk, events)
+                        stage.rows += len(chunk)
+
+                with stats.stage("rollup") as stage:
+                    rollup = [
+                        DailyTraffic(
+                            date=key[0],
+                            landing_page=key[1],
+                            referring_domain=key[2],
+                            device_type=key[3],
+                            visits=visits[key],
+                            events=events[key],
+                        )
+                        for key in set(visits) | set(events)
+                    ]
+                    stage.rows += len(rollup)
+                    if not options["dry"]:
+                        with transaction.atomic():
+                            DailyTraffic.objects.all().delete()
+                            DailyTraffic.objects.bulk_create(rollup, batch_size=1000)
+
+        except Exception as e:  # noqa
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            formatted_excption = traceback.format_exception(
+                exc_type, exc_value, exc_traceback
+            )
+            for line in formatted_excption:
+                self.stdout.write(line, ending="")
+            raise CommandError(
+                "An exception occurred. The previous rollup was left untouched.\n"
+            )
+
+        for line in stats.summary():
+            self.stdout.write(line)
+        self.stdout.write(
+            self.style.SUCCESS("Rolled up traffic into {} rows".format(len(rollup)))
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTraffic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('landing_page', models.CharField(blank=True, max_length=255, verbose_name='landing page')),
+                ('referring_domain', models.CharField(blank=True, max_length=255, verbose_name='referring domain')),
+                ('device_type', models.CharField(blank=True, max_length=64, verbose_name='device type')),
+                ('visits', models.PositiveIntegerField(default=0, verbose_name='visits')),
+                ('events', models.PositiveIntegerField(default=0, verbose_name='events')),
+            ],
+            options={
+                'verbose_name': 'Daily traffic',
+                'verbose_name_plural': 'Daily traffic',
+                'ordering': ('-date', '-visits'),
+                'unique_together': {('date', 'landing_page', 'referring_domain', 'device_type')},
+            },
+        ),
+    ]
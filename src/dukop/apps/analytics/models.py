@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class DailyTraffic(models.Model):
+    """
+    Daily number of visits and tracked events per landing page, referring
+    domain and device type. Rolled up from the raw traffic log of the old
+    site, see the rollup_detsker_traffic command.
+    """
+
+    date = models.DateField(verbose_name=_("date"))
+    landing_page = models.CharField(
+        max_length=255, blank=True, verbose_name=_("landing page")
+    )
+    referring_domain = models.CharField(
+        max_length=255, blank=True, verbose_name=_("referring domain")
+    )
+    device_type = models.CharField(
+        max_length=64, blank=True, verbose_name=_("device type")
+    )
+
+    visits = models.PositiveIntegerField(default=0, verbose_name=_("visits"))
+    events = models.PositiveIntegerField(default=0, verbose_name=_("events"))
+
+    class Meta:
+        ordering = ("-date", "-visits")
+        unique_together = ("date", "landing_page", "referring_domain", "device_type")
+        verbose_name = _("Daily traffic")
+        verbose_name_plural = _("Daily traffic")
+
+    def __str__(self):
+        return "{} {}".format(self.date, self.landing_page)
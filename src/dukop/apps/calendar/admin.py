@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.template.defaultfilters import truncatewords
 from django.utils.safestring import SafeText
 from django.utils.translation import gettext_lazy as _
 
@@ -11,6 +10,41 @@ class SphereAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(models.Venue)
+class VenueAdmin(admin.ModelAdmin):
+    list_display = (
+        "name",
+        "street",
+        "zip_code",
+        "city",
+        "latitude",
+        "longitude",
+        "event_count",
+    )
+    search_fields = ("name", "street", "city")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_event_count()
+
+    def event_count(self, instance):
+        return instance.event_count
+
+    event_count.admin_order_field = "event_count"
+    event_count.short_description = _("events")
+
+
+@admin.register(models.PostalCode)
+class PostalCodeAdmin(admin.ModelAdmin):
+    list_display = ("zip_code", "city", "latitude", "longitude")
+    search_fields = ("zip_code", "city")
+
+
+@admin.register(models.Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ("name", "name_da", "slug")
+    search_fields = ("name", "name_da")
+
+
 class EventTimeInline(admin.TabularInline):
     model = models.EventTime
 
@@ -29,20 +63,18 @@ class EventAdmin(admin.ModelAdmin):
         "name",
         "show_times",
         "venue_name",
-        "short_description_truncated",
+        "excerpt",
         "event_image",
     )
-    list_filter = ("featured", "published", "is_cancelled", "times__start")
+    list_filter = ("featured", "published", "is_cancelled", "tags", "times__start")
     inlines = [EventTimeInline, EventImageInlineAdmin, EventLinkInlineAdmin]
     search_fields = (
         "name",
         "venue_name",
     )
 
-    def short_description_truncated(self, instance):
-        return truncatewords(instance.short_description, 100)
-
-    short_description_truncated.short_description = _("short description")
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("times", "images")
 
     def show_times(self, instance):
         html = SafeText("<br>".join(str(time) for time in instance.times.all()))
@@ -7,4 +7,20 @@ class CalendarConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
 
     def ready(self):
+        from dukop.apps.utils.metrics import registry
+
+        from . import models
         from . import signals  # noqa
+
+        @registry.collector
+        def sphere_cache(registry):
+            info = models.Sphere.get_by_id_or_default_cached.cache_info()
+            registry.set(
+                "dukop_cache_requests_total", info.hits, cache="sphere", result="hit"
+            )
+            registry.set(
+                "dukop_cache_requests_total",
+                info.misses,
+                cache="sphere",
+                result="miss",
+            )
@@ -0,0 +1,99 @@
+"""
+Geohashes and distances for finding venues and events near a location.
+
+A geohash encodes a coordinate as a string where each added character narrows
+down the cell. Venues store the geohash of their coordinates, so a "near me"
+lookup can select candidates with an indexed prefix match on the few cells
+that cover the search radius, and only compute exact distances for those.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+EARTH_RADIUS_KM = 6371.0
+
+PRECISION = 12
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value_range, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def cell_size(precision):
+    """
+    Returns (height, width) of a geohash cell in degrees
+    """
+    lat_bits = (precision * 5) // 2
+    lng_bits = precision * 5 - lat_bits
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance (haversine)
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _steps(start, end, step):
+    values = []
+    value = start
+    while value < end:
+        values.append(value)
+        value += step
+    values.append(end)
+    return values
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes of the cells covering the bounding box of a circle. The
+    precision is chosen so that a cell is at least as large as the radius,
+    which means the box is covered by at most 3x3 cells.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    delta_lng = delta_lat / max(math.cos(math.radians(latitude)), 0.01)
+
+    precision = 1
+    for candidate in range(PRECISION, 0, -1):
+        height, width = cell_size(candidate)
+        if height >= delta_lat and width >= delta_lng:
+            precision = candidate
+            break
+    height, width = cell_size(precision)
+
+    lats = _steps(
+        max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0), height
+    )
+    lngs = _steps(longitude - delta_lng, longitude + delta_lng, width)
+    return {
+        encode(lat, (lng + 180.0) % 360.0 - 180.0, precision)
+        for lat in lats
+        for lng in lngs
+    }
@@ -0,0 +1,74 @@
+"""
+Renders the Markdown descriptions of existing events and event updates, and
+computes the excerpts and previews of events.
+
+New and edited rows are rendered when they are saved. This command covers
+rows from before the rendered fields existed, or all rows with --all, for
+instance after the Markdown extensions or the sanitizer have changed. Rows
+are rendered in batches and written with bulk_update, which leaves their
+modified timestamps untouched.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from dukop.apps.calendar import models
+
+
+class Command(BaseCommand):
+    help = "Render Markdown descriptions and excerpts of events and event updates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            default=False,
+            help="Render all rows, not only those that haven't been rendered",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of rows rendered and written at a time",
+        )
+
+    def handle(self, *args, **options):
+        events = models.Event.objects.only("id", "description", "short_description")
+        updates = models.EventUpdate.objects.only("id", "description")
+        if not options["all"]:
+            events = events.filter(
+                Q(description_rendered="", description__gt="")
+                | Q(excerpt="", description__gt="")
+                | Q(description_preview="", description__gt="")
+                | Q(excerpt="", short_description__gt="")
+            )
+            updates = updates.filter(description_rendered="", description__gt="")
+
+        count = self.backfill(
+            events,
+            ["description_rendered", "excerpt", "description_preview"],
+            options["batch_size"],
+        )
+        self.stdout.write("Rendered {} events".format(count))
+        count = self.backfill(updates, ["description_rendered"], options["batch_size"])
+        self.stdout.write("Rendered {} event updates".format(count))
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def backfill(self, queryset, fields, batch_size):
+        model = queryset.model
+        field = model._meta.get_field("description")
+        queryset = queryset.order_by("id")
+
+        count = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return count
+            for instance in batch:
+                field.pre_save(instance, add=False)
+                if model is models.Event:
+                    instance.update_excerpt()
+            with transaction.atomic():
+                model.objects.bulk_update(batch, fields)
+            count += len(batch)
+            last_id = batch[-1].id
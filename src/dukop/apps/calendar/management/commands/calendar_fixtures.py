@@ -1,22 +1,43 @@
 """
 For development purposes: Create a bunch of random events at random times.
+
+The data is generated from a seed, so the same seed, start date and options
+always give the same events. Rows are written with bulk_create in batches,
+and batches can be spread across worker processes. Each batch has its own
+random generator seeded from the seed and the batch number, so the result
+doesn't depend on the number of workers.
+
+Images are taken from a local directory of pictures. Each picture is stored
+once and shared by all the events that use it.
 """
-import json
+import calendar
+import hashlib
+import multiprocessing
 import os
 import random
 import sys
 import traceback
+from bisect import bisect_right
+from datetime import datetime
+from datetime import time
 from datetime import timedelta
+from functools import partial
+from itertools import accumulate
 
-import requests
 from django.contrib.sites.models import Site
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
+from django.db import connection
+from django.db import connections
 from django.db import transaction
+from django.db.models import Max
 from django.utils import timezone
+from django.utils.text import slugify
 from dukop.apps.calendar import models
 from dukop.apps.news.models import NewsStory
+from dukop.apps.users.models import Group
 
 
 LOREM_IPSUM = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deserunt mollit anim id est laborum."
@@ -24,7 +45,7 @@ LOREM_IPSUM = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do e
 LOREM_IPSUM_MARKDOWN = "## Lorem ipsum dolor sit amet\n\nconsectetur adipiscing elit\n\n### Sed do eiusmod tempor incididunt\n\n [A silly link](https://dr.dk) ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. Duis aute irure dolor in reprehenderit in voluptate velit esse cillum dolore eu fugiat nulla pariatur. Excepteur sint occaecat cupidatat non proident, sunt in culpa qui officia deserunt mollit anim id est laborum."
 
 
-def random_event_name():
+def random_event_name(rng=random):
     """
     Events of type {adverb} {thing} {proposition} {purpose}
     """
@@ -70,161 +91,293 @@ def random_event_name():
     ]
 
     return "{adverb} {thing} {proposition} {purpose}".format(
-        adverb=random.choice(adverbs),
-        thing=random.choice(things),
-        proposition=random.choice(propositions),
-        purpose=random.choice(purposes),
+        adverb=rng.choice(adverbs),
+        thing=rng.choice(things),
+        proposition=rng.choice(propositions),
+        purpose=rng.choice(purposes),
     )
 
 
-def random_venue():
-    return random.choice(
-        [
-            "Vakmærket",
-            "Unghomsduset",
-            "Holkets Fus",
-            "Hådruspladsen",
-        ]
-    )
+VENUES = [
+    ("Vakmærket", "Kløvermarksvej 70", "2300", "København S"),
+    ("Unghomsduset", "Dortheavej 61", "2400", "København NV"),
+    ("Holkets Fus", "Stengade 50", "2200", "København N"),
+    ("Hådruspladsen", "Rådhuspladsen 1", "1550", "København V"),
+]
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
 
-IMAGES = []
+# Share of events that get an image, recur weekly or are featured
+IMAGE_RATIO = 0.5
+RECURRING_RATIO = 0.1
+FEATURED_RATIO = 1 / 6
 
+# Number of weekly times created for a recurring event
+RECURRING_TIMES = 4
 
-def random_image(use_local=False):
-    global IMAGES
-    image_width = 1024
 
-    if use_local:
-        return open(
-            os.path.join(os.path.dirname(__file__), "testphoto.jpg"), "rb"
-        ).read()
+def store_image_pool(image_dir):
+    """
+    Stores every picture in image_dir once and returns the stored names
+    """
+    names = []
+    for filename in sorted(os.listdir(image_dir)):
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            continue
+        with open(os.path.join(image_dir, filename), "rb") as f:
+            data = f.read()
+        name = "uploads/events/fixture-{}{}".format(hashlib.sha1(data).hexdigest(), ext)
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        names.append(name)
+    return names
+
+
+def random_time(rng, day):
+    """
+    Returns a random start and end on the given day. Some events end the day
+    after.
+    """
+    start = day + timedelta(
+        hours=rng.randrange(0, 24), minutes=rng.choice([0, 0, 15, 30, 30, 45])
+    )
+    end = start + timedelta(hours=rng.randrange(1, 12 if rng.random() < 0.2 else 5))
+    return start, end
 
-    url = (
-        "http://commons.wikimedia.org/w/api.php"
-        "?action=query&generator=random"
-        "&grnnamespace=6"
-        "&prop=imageinfo"
-        "&iiprop=url"
-        "&iiurlwidth={}"
-        "&format=json"
-    ).format(image_width)
 
-    print(url)
+def free_slugs(events):
+    """
+    Numbered slugs can still be taken by events that were saved with the
+    same name before, so those get another suffix. Costs one query when
+    nothing collides.
+    """
+    used = {event.slug for event in events}
+    colliding = [(event, event.slug, 1) for event in events]
+    while colliding:
+        taken = set(
+            models.Event.objects.filter(
+                slug__in=[event.slug for event, __, __ in colliding]
+            ).values_list("slug", flat=True)
+        )
+        bumped = []
+        for event, base, suffix in colliding:
+            if event.slug not in taken:
+                continue
+            while event.slug in used:
+                suffix += 1
+                event.slug = "{}-{}".format(base, suffix)
+            used.add(event.slug)
+            bumped.append((event, base, suffix))
+        colliding = bumped
+
+
+def create_batch(context, batch):
+    """
+    Creates the events with numbers first to last with all their times,
+    intervals, images and spheres. Runs in a worker process when there are
+    several workers.
+    """
+    batch_number, first, last = batch
+    rng = random.Random("{}:{}".format(context["seed"], batch_number))
+
+    with transaction.atomic():
+        events = []
+        for number in range(first, last):
+            name = random_event_name(rng)
+            venue_id, venue_name, street, zip_code, city = rng.choice(context["venues"])
+            events.append(
+                models.Event(
+                    published=True,
+                    featured=rng.random() < FEATURED_RATIO,
+                    name=name,
+                    slug="{}-{}".format(
+                        slugify(name)[:35], context["slug_offset"] + number
+                    ),
+                    description=LOREM_IPSUM,
+                    short_description=LOREM_IPSUM[:100],
+                    venue_name=venue_name,
+                    street=street,
+                    zip_code=zip_code,
+                    city=city,
+                    venue_id=venue_id,
+                    host_id=rng.choice(context["groups"] + [None]),
+                )
+            )
+        free_slugs(events)
+        models.Event.objects.bulk_create(events)
+
+        # Not all backends set primary keys in bulk_create
+        if events and events[0].pk is None:
+            ids = dict(
+                models.Event.objects.filter(
+                    slug__in=[event.slug for event in events]
+                ).values_list("slug", "id")
+            )
+            for event in events:
+                event.pk = ids[event.slug]
+
+        times = []
+        intervals = []
+        images = []
+        spheres = []
+        for number, event in zip(range(first, last), events):
+            day = context["start"] + timedelta(
+                days=bisect_right(context["days"], number)
+            )
+            start, end = random_time(rng, day)
+            if rng.random() < RECURRING_RATIO:
+                intervals.append(
+                    models.EventInterval(
+                        event_id=event.pk,
+                        weekday_id=context["weekdays"][start.weekday()],
+                        every_week=True,
+                        starts=start,
+                        ends=start + timedelta(weeks=RECURRING_TIMES),
+                    )
+                )
+                weeks = RECURRING_TIMES
+            else:
+                weeks = 1
+            for week in range(weeks):
+                times.append(
+                    models.EventTime(
+                        event_id=event.pk,
+                        start=start + timedelta(weeks=week),
+                        end=end + timedelta(weeks=week),
+                        comment="This is a randomly generated time",
+                        interval_auto=weeks > 1,
+                    )
+                )
+            if context["images"] and rng.random() < IMAGE_RATIO:
+                images.append(
+                    models.EventImage(
+                        event_id=event.pk, image=rng.choice(context["images"])
+                    )
+                )
+            if context["spheres"]:
+                spheres.append(
+                    models.Event.spheres.through(
+                        event_id=event.pk, sphere_id=rng.choice(context["spheres"])
+                    )
+                )
+
+        models.EventTime.objects.bulk_create(times)
+        models.EventInterval.objects.bulk_create(intervals)
+        models.EventImage.objects.bulk_create(images)
+        models.Event.spheres.through.objects.bulk_create(spheres)
 
-    if len(IMAGES) < 10:
-        r = requests.get(url)
-        data = json.loads(r.content)
-        image_url = data["query"]["pages"][list(data["query"]["pages"].keys())[0]][
-            "imageinfo"
-        ][0]["thumburl"]
-        print(image_url)
-        r = requests.get(image_url)
-        IMAGES.append(r.content)
-        return r.content
-    return random.choice(IMAGES)
+    return len(events), len(times), len(images)
 
 
 class Command(BaseCommand):
     help = "Create test data"
 
     def add_arguments(self, parser):
-        # Positional arguments are standalone name
-        # parser.add_argument('store_id')
-
         parser.add_argument(
             "--max-per-day",
             type=int,
             default=5,
-            help="Maximum amount (0-max) created per day",
+            help="Maximum amount (1-max) created per day",
         )
         parser.add_argument(
             "--days",
             type=int,
             default=10,
-            help="Number of days from now and into future",
+            help="Number of days from the start date and into future",
+        )
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=None,
+            help="Total number of events spread evenly over the days, overrides --max-per-day",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed for the random data, the same seed gives the same data",
+        )
+        parser.add_argument(
+            "--start-date",
+            type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(),
+            default=None,
+            help="First day of events as YYYY-MM-DD, defaults to today",
+        )
+        parser.add_argument(
+            "--groups",
+            type=int,
+            default=10,
+            help="Number of groups hosting the events",
+        )
+        parser.add_argument(
+            "--spheres",
+            type=int,
+            default=1,
+            help="Number of spheres that the events are spread across",
+        )
+        parser.add_argument(
+            "--image-dir",
+            default=os.path.dirname(__file__),
+            help="Directory with pictures used for event images",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of events created in each batch",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes creating batches",
         )
         parser.add_argument(
             "--local-image",
             type=bool,
             default=False,
-            help="Use the local test image, not from Wikimedia",
+            help="Deprecated: images are always taken from --image-dir",
         )
 
-    @transaction.atomic
     def handle(self, *args, **options):
-
-        no_days = options["days"]
-        max_per_day = options["max_per_day"]
-        local_image = options.get("local_image", False)
         try:
             self.stdout.write("Starting to import")
 
-            for n in range(no_days):
-
-                for __ in range(random.choice(range(1, max_per_day))):
-
-                    start = (timezone.now() + timedelta(days=n)).replace(
-                        hour=0, minute=0, second=0
-                    )
-                    end = (
-                        timezone.now()
-                        + timedelta(days=n + random.choice([0, 0, 0, 0, 0, 1]))
-                    ).replace(hour=0, minute=0, second=0)
-
-                    start += timedelta(hours=random.choice(range(0, 24)))
-                    start += timedelta(minutes=random.choice([0, 0, 15, 30, 30, 45]))
-                    end += timedelta(hours=random.choice(range(0, 24)))
-                    end += timedelta(minutes=random.choice([0, 0, 15, 30, 30, 45]))
-
-                    event = models.Event.objects.create(
-                        published=True,
-                        featured=random.choice(
-                            [False, False, False, False, False, True]
-                        ),
-                        name=random_event_name(),
-                        description=LOREM_IPSUM,
-                        short_description=LOREM_IPSUM[:100],
-                        venue_name=random_venue(),
-                    )
-                    models.EventTime.objects.create(
-                        event=event,
-                        start=start,
-                        end=end,
-                        comment="This is a randomly generated time",
-                    )
+            context = self.get_context(options)
 
-                    if random.choice([True, False]):
-                        image_data = random_image(use_local=local_image)
-                        event_image = models.EventImage(event=event)
-                        event_image.image.save("jpeg", ContentFile(image_data))
-                        event_image.save()
+            batch_size = options["batch_size"]
+            total = context["days"][-1] if context["days"] else 0
+            batches = [
+                (batch_number, first, min(first + batch_size, total))
+                for batch_number, first in enumerate(range(0, total, batch_size))
+            ]
 
-            if NewsStory.objects.all().count() == 0:
+            workers = options["workers"]
+            if workers > 1 and connection.vendor == "sqlite":
                 self.stdout.write(
-                    "No News stories found, so creating 2 of those, too...\n".format()
-                )
-                NewsStory.objects.create(
-                    headline="Developers be having fun",
-                    short_story="A developer is working hard right now!",
-                    text=LOREM_IPSUM_MARKDOWN,
-                    published=True,
-                )
-                NewsStory.objects.create(
-                    headline="We think Django is great",
-                    short_story="We used a web framework called Django this time. It's going great. Click to read more.",
-                    text=LOREM_IPSUM_MARKDOWN,
-                    published=True,
-                    url="https://www.djangoproject.com/",
+                    self.style.WARNING(
+                        "SQLite has one writer at a time, so using one process"
+                    )
                 )
+                workers = 1
+
+            create = partial(create_batch, context)
+            if workers > 1:
+                # Forked workers must open their own database connections
+                connections.close_all()
+                pool = multiprocessing.get_context("fork").Pool(workers)
+                with pool:
+                    results = pool.imap_unordered(create, batches)
+                    counts = self.report_batches(results, total)
+            else:
+                counts = self.report_batches(map(create, batches), total)
+
+            self.stdout.write(
+                "Created {} events, {} times and {} images".format(*counts)
+            )
 
-            if Site.objects.filter(domain="example.com").exists():
-                Site.objects.filter(domain="example.com").update(
-                    domain="localhost:8000"
-                )
-                self.stdout.write(
-                    self.style.SUCCESS("Changed example.com to localhost:8000")
-                )
+            self.create_news_and_site()
 
             self.stdout.write(self.style.SUCCESS("Created a bunch of example data"))
 
@@ -236,8 +389,106 @@ class Command(BaseCommand):
             for line in formatted_excption:
                 self.stdout.write(line, ending="")
             raise CommandError(
-                "An exception occurred. All operations aborted, database rolled back.\n"
+                "An exception occurred. Batches that were completed are kept.\n"
+            )
+
+    def get_context(self, options):
+        """
+        Creates the shared rows and returns everything that the batches need
+        """
+        rng = random.Random(options["seed"])
+
+        if options["events"] is None:
+            per_day = [
+                rng.randint(1, max(options["max_per_day"], 1))
+                for __ in range(options["days"])
+            ]
+        else:
+            per_day = [
+                (day + 1) * options["events"] // options["days"]
+                - day * options["events"] // options["days"]
+                for day in range(options["days"])
+            ]
+
+        start_date = options["start_date"] or timezone.localdate()
+        start = timezone.make_aware(datetime.combine(start_date, time()))
+
+        venues = []
+        for name, street, zip_code, city in VENUES:
+            venue = models.Venue.objects.for_address(
+                name, street=street, zip_code=zip_code, city=city
+            )
+            venues.append((venue.id, name, street, zip_code, city))
+
+        groups = [
+            Group.objects.get_or_create(
+                name="Fixture group {}".format(number + 1),
+                defaults={"description": LOREM_IPSUM[:200]},
+            )[0].id
+            for number in range(options["groups"])
+        ]
+        spheres = [
+            models.Sphere.objects.get_or_create(
+                name="Fixture sphere {}".format(number + 1)
+            )[0].id
+            for number in range(options["spheres"])
+        ]
+
+        # Created by a data migration, but flushed by transactional tests
+        weekdays = {
+            number: models.Weekday.objects.get_or_create(
+                number=number, defaults={"name": calendar.day_name[number]}
+            )[0].id
+            for number in range(7)
+        }
+
+        return {
+            "seed": options["seed"],
+            # Slugs are numbered from the highest id so they are rarely taken,
+            # free_slugs checks them in one query per batch
+            "slug_offset": (models.Event.objects.aggregate(Max("id"))["id__max"] or 0)
+            + 1,
+            "start": start,
+            # Number of events created up to and including each day
+            "days": list(accumulate(per_day)),
+            "venues": venues,
+            "groups": groups,
+            "spheres": spheres,
+            "weekdays": weekdays,
+            "images": store_image_pool(options["image_dir"]),
+        }
+
+    def report_batches(self, results, total):
+        events = times = images = 0
+        for batch_events, batch_times, batch_images in results:
+            events += batch_events
+            times += batch_times
+            images += batch_images
+            self.stdout.write("Created {}/{} events".format(events, total))
+        return events, times, images
+
+    @transaction.atomic
+    def create_news_and_site(self):
+        if NewsStory.objects.all().count() == 0:
+            self.stdout.write(
+                "No News stories found, so creating 2 of those, too...\n".format()
+            )
+            NewsStory.objects.create(
+                headline="Developers be having fun",
+                short_story="A developer is working hard right now!",
+                text=LOREM_IPSUM_MARKDOWN,
+                published=True,
+            )
+            NewsStory.objects.create(
+                headline="We think Django is great",
+                short_story="We used a web framework called Django this time. It's going great. Click to read more.",
+                text=LOREM_IPSUM_MARKDOWN,
+                published=True,
+                url="https://www.djangoproject.com/",
             )
 
-        if options.get("dry"):
-            raise CommandError("Dry-running so aborting transactions.")
+        if Site.objects.filter(domain="example.com").exists():
+            Site.objects.filter(domain="example.com").update(domain="localhost:8000")
+            self.stdout.write(
+                self.style.SUCCESS("Changed example.com to localhost:8000")
+            )
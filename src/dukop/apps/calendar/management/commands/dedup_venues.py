@@ -0,0 +1,104 @@
+"""
+Links events to normalized venues and merges duplicate venues.
+
+Events without a venue get one from their address fields: Missing venues are
+created with bulk_create, and events are updated with bulk_update. Venues
+whose normalized addresses are equal, for instance after the normalization
+has changed, are merged into the oldest one.
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dukop.apps.calendar import models
+from dukop.apps.calendar.utils import normalize_address
+
+
+class Command(BaseCommand):
+    help = "Link events to venues and merge duplicate venues"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written at a time",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        merged = self.merge_venues()
+        linked = self.link_events(batch_size)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Merged {} duplicate venues and linked {} events".format(merged, linked)
+            )
+        )
+
+    def merge_venues(self):
+        duplicates = defaultdict(list)
+        for venue in models.Venue.objects.order_by("id"):
+            venue.update_normalized_address()
+            duplicates[venue.normalized_address].append(venue)
+
+        merged = 0
+        keepers = []
+        for venues in duplicates.values():
+            keeper, others = venues[0], venues[1:]
+            keepers.append(keeper)
+            if not others:
+                continue
+            for other in others:
+                if keeper.latitude is None and other.latitude is not None:
+                    keeper.latitude = other.latitude
+                    keeper.longitude = other.longitude
+            keeper.update_geohash()
+            models.Event.objects.filter(venue__in=others).update(venue=keeper)
+            models.Venue.objects.filter(pk__in=[other.pk for other in others]).delete()
+            merged += len(others)
+
+        models.Venue.objects.bulk_update(
+            keepers, ["normalized_address", "latitude", "longitude", "geohash"]
+        )
+        return merged
+
+    def link_events(self, batch_size):
+        events = list(
+            models.Event.objects.filter(venue=None)
+            .exclude(venue_name=None)
+            .exclude(venue_name="")
+            .only("id", "venue_name", "street", "zip_code", "city")
+            .prefetch_related(None)
+        )
+
+        venue_ids = dict(models.Venue.objects.values_list("normalized_address", "id"))
+        new_venues = {}
+        for event in events:
+            event.normalized_address = normalize_address(
+                event.venue_name, event.street, event.zip_code, event.city
+            )
+            if (
+                event.normalized_address not in venue_ids
+                and event.normalized_address not in new_venues
+            ):
+                venue = models.Venue(
+                    name=event.venue_name,
+                    street=event.street,
+                    zip_code=event.zip_code,
+                    city=event.city,
+                )
+                venue.geocode()
+                venue.update_normalized_address()
+                venue.update_geohash()
+                new_venues[event.normalized_address] = venue
+
+        models.Venue.objects.bulk_create(new_venues.values(), batch_size=batch_size)
+        venue_ids = dict(models.Venue.objects.values_list("normalized_address", "id"))
+
+        for event in events:
+            event.venue_id = venue_ids[event.normalized_address]
+        models.Event.objects.bulk_update(events, ["venue"], batch_size=batch_size)
+        return len(events)
@@ -0,0 +1,95 @@
+"""
+Loads the local postal code table that venues without coordinates are
+geocoded from.
+
+Coordinates are read from a CSV file with the columns zip_code, city,
+latitude and longitude, and/or derived from the average position of the
+venues that already have coordinates. Venues that can then be geocoded are
+updated in bulk.
+"""
+import csv
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Avg
+from django.db.models import Max
+from dukop.apps.calendar import models
+
+
+class Command(BaseCommand):
+    help = "Load postal code coordinates for offline geocoding of venues"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "csv_file",
+            type=str,
+            nargs="?",
+            help="CSV file with zip_code, city, latitude and longitude columns",
+        )
+        parser.add_argument(
+            "--from-venues",
+            action="store_true",
+            default=False,
+            help="Use the average coordinates of venues with the same zip code",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if not options["csv_file"] and not options["from_venues"]:
+            raise CommandError("Give a CSV file and/or --from-venues")
+
+        postal_codes = {}
+
+        if options["csv_file"]:
+            with open(options["csv_file"], newline="") as csv_file:
+                for row in csv.DictReader(csv_file):
+                    postal_codes[row["zip_code"]] = models.PostalCode(
+                        zip_code=row["zip_code"],
+                        city=row.get("city", ""),
+                        latitude=float(row["latitude"]),
+                        longitude=float(row["longitude"]),
+                    )
+
+        if options["from_venues"]:
+            centroids = (
+                models.Venue.objects.exclude(latitude=None)
+                .exclude(longitude=None)
+                .exclude(zip_code=None)
+                .exclude(zip_code="")
+                .values("zip_code")
+                .annotate(Avg("latitude"), Avg("longitude"), Max("city"))
+            )
+            for centroid in centroids:
+                postal_codes.setdefault(
+                    centroid["zip_code"],
+                    models.PostalCode(
+                        zip_code=centroid["zip_code"],
+                        city=centroid["city__max"] or "",
+                        latitude=centroid["latitude__avg"],
+                        longitude=centroid["longitude__avg"],
+                    ),
+                )
+
+        models.PostalCode.objects.filter(zip_code__in=postal_codes.keys()).delete()
+        models.PostalCode.objects.bulk_create(postal_codes.values(), batch_size=1000)
+
+        venues = list(
+            models.Venue.objects.filter(latitude=None, zip_code__in=postal_codes.keys())
+        )
+        for venue in venues:
+            postal_code = postal_codes[venue.zip_code]
+            venue.latitude = postal_code.latitude
+            venue.longitude = postal_code.longitude
+            venue.update_geohash()
+        models.Venue.objects.bulk_update(
+            venues, ["latitude", "longitude", "geohash"], batch_size=1000
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Loaded {} postal codes and geocoded {} venues".format(
+                    len(postal_codes), len(venues)
+                )
+            )
+        )
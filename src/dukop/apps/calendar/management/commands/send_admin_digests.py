@@ -0,0 +1,58 @@
+"""
+Queues the digests of new events for admins who don't want an email per event.
+
+An admin's digest is due when the oldest event waiting in it is older than
+the admin's User.admin_digest_minutes. Each digest is stored in the outbox
+in the same transaction as the notifications are removed, and sent by the
+send_outbox command. Run this command from cron every few minutes.
+
+Only the notifications that went into a digest are removed, so events created
+during a run wait for the next digest. The notifications are locked while
+they are handled, so overlapping runs never put an event in two digests.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from dukop.apps.calendar import models
+from dukop.apps.users import email
+
+
+class Command(BaseCommand):
+    help = "Queue the due digests of new events for sphere admins"
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        now = timezone.now()
+        models.AdminNotification.objects.filter(user__is_active=False).delete()
+
+        pending = {}
+        notifications = (
+            models.AdminNotification.objects.select_related("user", "event")
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("created", "id")
+        )
+        for notification in notifications:
+            pending.setdefault(notification.user, []).append(notification)
+
+        due = []
+        for user, notifications in pending.items():
+            # An admin who went back to single emails gets the rest at once
+            delay = timedelta(minutes=user.admin_digest_minutes)
+            if notifications[0].created + delay <= now:
+                email.AdminEventDigest(
+                    user=user,
+                    context={"events": [n.event for n in notifications]},
+                ).queue()
+                due += notifications
+
+        models.AdminNotification.objects.filter(pk__in=[n.pk for n in due]).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Queued digests of {} events for {} admins".format(
+                    len(due), len({n.user_id for n in due})
+                )
+            )
+        )
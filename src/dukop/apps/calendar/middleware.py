@@ -1,6 +1,25 @@
+import cProfile
+import logging
+import random
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import reraise
+from django.template.backends.django import Template as DjangoTemplate
+from django.utils.text import slugify
+
 from . import models
 
 
+logger = logging.getLogger("dukop.profiling")
+
+
 def sphere_middleware(get_response):
     """
     Sets the current sphere according to some cookie
@@ -17,3 +36,159 @@ def sphere_middleware(get_response):
         return response
 
     return middleware
+
+
+class RequestProfile:
+    """
+    Timings of a single request. Times are in seconds.
+    """
+
+    def __init__(self):
+        self.total = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.queries = []
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_time += duration
+            self.queries.append((duration, sql))
+
+    def slowest_queries(self, count):
+        return sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+
+    def server_timing(self):
+        return ", ".join(
+            [
+                "total;dur={:.1f}".format(self.total * 1000),
+                "sql;dur={:.1f};desc={}".format(self.sql_time * 1000, self.sql_count),
+                "template;dur={:.1f}".format(self.template_time * 1000),
+            ]
+        )
+
+
+class ProfiledTemplate(DjangoTemplate):
+    """
+    Adds the render time to the profile of the request it is rendered for.
+    Included and extended templates are rendered by the engine, so they are
+    part of that time.
+    """
+
+    def render(self, context=None, request=None):
+        profile = getattr(request, "dukop_profile", None)
+        if profile is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+
+
+class ProfilingTemplates(DjangoTemplates):
+    """
+    The Django template backend with templates that are timed by the
+    profiling middleware
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in with DUKOP_PROFILING. Logs the total time, SQL count and time,
+    template render time and slowest queries of each request, and warns about
+    requests that are slower or run more queries than the thresholds. A
+    fraction of requests is run with cProfile and dumped to
+    DUKOP_PROFILING_DIR, which can be read with pstats or snakeviz.
+
+    Staff get the timings in a Server-Timing header, and everyone does with
+    DUKOP_PROFILING_SERVER_TIMING.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "DUKOP_PROFILING", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = settings.DUKOP_PROFILING_SAMPLE_RATE
+        self.profile_dir = Path(settings.DUKOP_PROFILING_DIR)
+        self.slow_request = settings.DUKOP_PROFILING_SLOW_REQUEST_MS / 1000
+        self.max_queries = settings.DUKOP_PROFILING_MAX_QUERIES
+        self.slowest_count = settings.DUKOP_PROFILING_SLOWEST_QUERIES
+        self.server_timing = settings.DUKOP_PROFILING_SERVER_TIMING
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        request.dukop_profile = profile
+        profiler = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        try:
+            response = self.run(request, profile, profiler)
+        finally:
+            profile.total = time.perf_counter() - started
+
+        user = getattr(request, "user", None)
+        if self.server_timing or (user is not None and user.is_staff):
+            response["Server-Timing"] = profile.server_timing()
+        self.log(request, response, profile)
+        if profiler:
+            self.dump_stats(request, profile, profiler)
+        return response
+
+    def run(self, request, profile, profiler):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.record_query))
+            if profiler:
+                profiler.enable()
+                stack.callback(profiler.disable)
+            return self.get_response(request)
+
+    def log(self, request, response, profile):
+        summary = (
+            "{} {} {} {:.0f}ms, {} queries in {:.0f}ms, templates {:.0f}ms".format(
+                request.method,
+                request.path,
+                response.status_code,
+                profile.total * 1000,
+                profile.sql_count,
+                profile.sql_time * 1000,
+                profile.template_time * 1000,
+            )
+        )
+        if profile.total > self.slow_request or profile.sql_count > self.max_queries:
+            slowest = "".join(
+                "\n  {:.1f}ms {}".format(duration * 1000, sql)
+                for duration, sql in profile.slowest_queries(self.slowest_count)
+            )
+            logger.warning("Slow request: %s%s", summary, slowest)
+        else:
+            logger.info(summary)
+
+    def dump_stats(self, request, profile, profiler):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(
+            self.profile_dir
+            / "{}-{}-{}-{:.0f}ms.prof".format(
+                time.strftime("%Y%m%d-%H%M%S"),
+                request.method,
+                slugify(request.path)[:100] or "root",
+                profile.total * 1000,
+            )
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0017_alter_sphere_admins'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OldSyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=255, unique=True)),
+                ('last_old_fk', models.PositiveIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
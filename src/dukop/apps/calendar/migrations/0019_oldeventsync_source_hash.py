@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0018_oldsynccheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oldeventsync',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', help_text='Hash of the imported columns of the old row', max_length=40),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0019_oldeventsync_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('name_da', models.CharField(blank=True, max_length=255, verbose_name='name (Danish)')),
+                ('slug', models.SlugField(unique=True, verbose_name='slug')),
+            ],
+            options={
+                'verbose_name': 'Tag',
+                'verbose_name_plural': 'Tags',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='eventtime',
+            index=models.Index(fields=['start', 'end'], name='calendar_ev_start_10e061_idx'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='events', to='calendar.Tag', verbose_name='tags'),
+        ),
+    ]
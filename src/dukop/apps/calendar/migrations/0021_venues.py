@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0020_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostalCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zip_code', models.CharField(max_length=16, unique=True)),
+                ('city', models.CharField(blank=True, max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+            options={
+                'verbose_name': 'Postal code',
+                'verbose_name_plural': 'Postal codes',
+                'ordering': ('zip_code',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Venue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('street', models.CharField(blank=True, max_length=255, null=True, verbose_name='street')),
+                ('city', models.CharField(blank=True, max_length=255, null=True, verbose_name='city')),
+                ('zip_code', models.CharField(blank=True, max_length=16, null=True, verbose_name='zip code')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='latitude')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='longitude')),
+                ('geohash', models.CharField(blank=True, db_index=True, editable=False, max_length=12)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Venue',
+                'verbose_name_plural': 'Venues',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='venue',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='calendar.venue', verbose_name='venue'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:02
+
+from django.db import migrations, models
+from dukop.apps.calendar.utils import normalize_address
+
+
+def merge_duplicate_venues(apps, schema_editor):
+    """
+    Fills in normalized addresses. Venues with the same normalized address
+    are merged into the oldest one before the unique index is added.
+    """
+    Venue = apps.get_model('calendar', 'Venue')
+    Event = apps.get_model('calendar', 'Event')
+
+    keep = {}
+    for venue in Venue.objects.order_by('id'):
+        normalized_address = normalize_address(
+            venue.name, venue.street, venue.zip_code, venue.city
+        )
+        if normalized_address in keep:
+            Event.objects.filter(venue=venue).update(venue=keep[normalized_address])
+            venue.delete()
+        else:
+            venue.normalized_address = normalized_address
+            venue.save(update_fields=['normalized_address'])
+            keep[normalized_address] = venue
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0021_venues'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venue',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=1024, null=True),
+        ),
+        migrations.RunPython(merge_duplicate_venues, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='venue',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=1024, unique=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:49
+
+from django.db import migrations
+import markdownfield.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0022_venue_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='description_rendered',
+            field=markdownfield.models.RenderedMarkdownField(default=''),
+        ),
+        migrations.AddField(
+            model_name='eventupdate',
+            name='description_rendered',
+            field=markdownfield.models.RenderedMarkdownField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='description',
+            field=markdownfield.models.MarkdownField(blank=True, help_text="Enter details, which will be displayed on the event's own page. You can use Markdown.", rendered_field='description_rendered', use_editor=False, verbose_name='description'),
+        ),
+        migrations.AlterField(
+            model_name='eventupdate',
+            name='description',
+            field=markdownfield.models.MarkdownField(blank=True, rendered_field='description_rendered', use_editor=False, verbose_name='description'),
+        ),
+    ]
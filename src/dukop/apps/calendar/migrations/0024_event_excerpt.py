@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0023_event_description_rendered'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, help_text='The short description or the start of the description', max_length=1024, verbose_name='excerpt'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:53
+
+from django.db import migrations, models
+from dukop.apps.calendar.utils import free_slug
+
+
+def dedupe_slugs(apps, schema_editor):
+    """
+    Gives every event and sphere but the oldest with the same slug a free
+    slug before the unique indexes are added. Empty slugs become NULL.
+    """
+    for model_name in ('Event', 'Sphere'):
+        Model = apps.get_model('calendar', model_name)
+        Model.objects.filter(slug='').update(slug=None)
+
+        taken = set()
+        for instance in Model.objects.exclude(slug=None).order_by('id').only('id', 'slug'):
+            if instance.slug in taken:
+                instance.slug = free_slug(instance.slug, taken)
+                instance.save(update_fields=['slug'])
+            taken.add(instance.slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0024_event_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='slug',
+            field=models.SlugField(blank=True, help_text='The part of a URL that is displayed in dukop.dk/event/<slug>/', null=True, unique=True, verbose_name='slug'),
+        ),
+        migrations.AlterField(
+            model_name='sphere',
+            name='slug',
+            field=models.SlugField(blank=True, help_text='The part of a URL that is displayed in dukop.dk/sphere/<slug>/', null=True, unique=True, verbose_name='slug'),
+        ),
+    ]
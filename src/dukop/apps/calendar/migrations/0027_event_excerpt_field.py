@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:23
+
+from django.db import migrations
+import dukop.apps.calendar.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar', '0026_admin_notification'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='excerpt',
+            field=dukop.apps.calendar.models.ExcerptField(blank=True, editable=False, help_text='The short description or the start of the description', max_length=1024, verbose_name='excerpt'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:38
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("calendar", "0027_event_excerpt_field"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="description_preview",
+            field=models.TextField(
+                default="",
+                editable=False,
+                help_text="The start of the rendered description, shown in listings",
+                verbose_name="description preview",
+            ),
+        ),
+    ]
@@ -1,20 +1,30 @@
 import os
-import random
-import string
 import uuid
 from builtins import staticmethod
 from functools import lru_cache
+from functools import partial
 
 from django.contrib.sites.models import Site
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Q
 from django.urls.base import reverse
 from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from dukop.apps.calendar.utils import display_datetime
 from dukop.apps.calendar.utils import display_time
+from dukop.apps.users.models import Group
+from markdownfield.models import MarkdownField
+from markdownfield.models import RenderedMarkdownField
+from markdownfield.validators import VALIDATOR_STANDARD
 from sorl.thumbnail import get_thumbnail
 
+from . import geo
 from . import utils
 
 
@@ -26,29 +36,83 @@ def image_upload_to(instance, filename):
 
 def sluggify_instance(instance, ModelClass, name_field, slug_field):
     """
-    Auto-populates a slug field if it isn't filled in.
+    Auto-populates a slug field if it isn't filled in. If the slugified name
+    is taken, a number is appended. The taken slugs are found with a single
+    query.
     """
     if not instance.pk and not getattr(instance, slug_field, None):
-        proposal = slugify(getattr(instance, name_field))[:50]
+        max_length = ModelClass._meta.get_field(slug_field).max_length
+        base = (
+            slugify(getattr(instance, name_field))[:max_length]
+            or ModelClass._meta.model_name
+        )
+        taken = ModelClass.objects.filter(
+            **{
+                slug_field
+                + "__startswith": base[: max_length - utils.SLUG_SUFFIX_LENGTH],
+                slug_field + "__regex": utils.slug_pattern(base, max_length),
+            }
+        ).values_list(slug_field, flat=True)
+        setattr(instance, slug_field, utils.free_slug(base, set(taken), max_length))
 
-        def _proposal_exists():
-            return ModelClass.objects.filter(**{slug_field: proposal}).exists()
 
-        proposal_exists = _proposal_exists()
-        while proposal_exists:
-            to_append = "".join(
-                random.choice(string.ascii_uppercase + string.digits) for _ in range(10)
-            )
-            proposal = proposal[:40] + to_append
-            proposal_exists = _proposal_exists()
-        setattr(instance, slug_field, proposal)
+class ExcerptField(models.CharField):
+    """
+    Updates the excerpt and preview of the instance when it is saved. Fields
+    are saved in the order they are declared, so a rendered Markdown field
+    declared before it has already been rendered, and a preview field declared
+    after it is saved with the updated value.
+    """
 
+    def pre_save(self, model_instance, add):
+        model_instance.update_excerpt()
+        return super().pre_save(model_instance, add)
 
-class EventManager(models.Manager):
-    def get_queryset(self):
-        return (
-            super().get_queryset().prefetch_related("times").prefetch_related("images")
+
+# Attempts at saving a new object with a slug that another save took first
+SLUG_ATTEMPTS = 3
+
+
+def save_with_slug(instance, ModelClass, name_field, slug_field, save):
+    """
+    Populates the slug and calls save(). Slugs have unique indexes, so if a
+    concurrent save took the same slug, a new one is allocated.
+    """
+    if instance.pk or getattr(instance, slug_field, None):
+        return save()
+    for attempt in range(SLUG_ATTEMPTS):
+        sluggify_instance(instance, ModelClass, name_field, slug_field)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            if attempt == SLUG_ATTEMPTS - 1:
+                raise
+            setattr(instance, slug_field, None)
+
+
+class EventQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Events that the user may see: Staff see everything, others see
+        published events and the events owned by them or their groups
+        """
+        if user.is_staff:
+            return self
+        if not user.is_authenticated:
+            return self.filter(published=True)
+        is_group_member = Exists(
+            Group.members.through.objects.filter(
+                group_id=OuterRef("owner_group_id"), user_id=user.pk
+            )
         )
+        return self.filter(Q(published=True) | Q(owner_user=user) | is_group_member)
+
+    def for_detail(self):
+        """
+        Loads everything shown on the event page with one query per relation
+        """
+        return self.select_related("host", "venue").prefetch_related("times", "images")
 
 
 class EventTimeQuerySet(models.QuerySet):
@@ -56,6 +120,27 @@ class EventTimeQuerySet(models.QuerySet):
         now = utils.get_now()
         return self.filter(start__gte=now)
 
+    def between(self, from_date, to_date):
+        """
+        Times overlapping the given range
+        """
+        return self.filter(end__gte=from_date, start__lte=to_date)
+
+    def tagged(self, tag):
+        """
+        Times of events with the given tag, a Tag or its slug
+        """
+        if isinstance(tag, str):
+            return self.filter(event__tags__slug=tag)
+        return self.filter(event__tags=tag)
+
+    def near(self, latitude, longitude, radius_km):
+        """
+        Times of events at venues within radius_km of a point
+        """
+        venues = Venue.objects.near(latitude, longitude, radius_km)
+        return self.filter(event__venue__in=[venue.pk for venue in venues])
+
 
 class EventTimeManager(models.Manager):
     def get_queryset(self):
@@ -64,6 +149,61 @@ class EventTimeManager(models.Manager):
     def future(self):
         return self.get_queryset().future()
 
+    def between(self, from_date, to_date):
+        return self.get_queryset().between(from_date, to_date)
+
+    def tagged(self, tag):
+        return self.get_queryset().tagged(tag)
+
+    def near(self, latitude, longitude, radius_km):
+        return self.get_queryset().near(latitude, longitude, radius_km)
+
+
+class VenueQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_km):
+        """
+        Venues within radius_km of a point, nearest first and with a distance
+        attribute.
+
+        Candidates are selected by an indexed prefix match on the geohash cells
+        that cover the radius, exact distances are only computed for those.
+        """
+        in_cells = Q()
+        for cell in geo.covering_cells(latitude, longitude, radius_km):
+            in_cells |= Q(geohash__startswith=cell)
+
+        venues = []
+        for venue in self.filter(in_cells):
+            venue.distance = geo.distance_km(
+                latitude, longitude, venue.latitude, venue.longitude
+            )
+            if venue.distance <= radius_km:
+                venues.append(venue)
+        return sorted(venues, key=lambda venue: venue.distance)
+
+    def with_event_count(self):
+        return self.annotate(event_count=Count("events"))
+
+    def for_address(self, name, street=None, zip_code=None, city=None, **defaults):
+        """
+        Returns the venue with the same normalized address, creating it if
+        it doesn't exist. This is a single lookup on a unique index.
+        """
+        normalized_address = utils.normalize_address(name, street, zip_code, city)
+        try:
+            return self.get(normalized_address=normalized_address)
+        except self.model.DoesNotExist:
+            venue = self.model(
+                name=name, street=street, zip_code=zip_code, city=city, **defaults
+            )
+            try:
+                with transaction.atomic():
+                    venue.save()
+                return venue
+            except IntegrityError:
+                # Created concurrently
+                return self.get(normalized_address=normalized_address)
+
 
 class Sphere(models.Model):
     """
@@ -76,6 +216,7 @@ class Sphere(models.Model):
     slug = models.SlugField(
         null=True,
         blank=True,
+        unique=True,
         verbose_name=_("slug"),
         help_text=_("The part of a URL that is displayed in dukop.dk/sphere/<slug>/"),
     )
@@ -93,8 +234,9 @@ class Sphere(models.Model):
         verbose_name_plural = _("Spheres")
 
     def save(self, *args, **kwargs):
-        sluggify_instance(self, Sphere, "name", "slug")
-        return super().save(*args, **kwargs)
+        return save_with_slug(
+            self, Sphere, "name", "slug", partial(super().save, *args, **kwargs)
+        )
 
     def __str__(self):
         return self.name
@@ -142,6 +284,146 @@ class Sphere(models.Model):
         return Sphere.get_by_id_or_default(sphere_id=sphere_id)
 
 
+class PostalCode(models.Model):
+    """
+    A local table of coordinates for postal codes, used to geocode venues
+    without coordinates offline. See the load_postal_codes command.
+    """
+
+    zip_code = models.CharField(max_length=16, unique=True)
+    city = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        ordering = ("zip_code",)
+        verbose_name = _("Postal code")
+        verbose_name_plural = _("Postal codes")
+
+    def __str__(self):
+        return "{} {}".format(self.zip_code, self.city)
+
+
+class Venue(models.Model):
+    """
+    A place where events happen. The geohash of its coordinates is indexed,
+    so events near a location can be found without scanning every event.
+    """
+
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("name"),
+    )
+    street = models.CharField(
+        max_length=255,
+        verbose_name=_("street"),
+        blank=True,
+        null=True,
+    )
+    city = models.CharField(
+        max_length=255,
+        verbose_name=_("city"),
+        blank=True,
+        null=True,
+    )
+    zip_code = models.CharField(
+        verbose_name=_("zip code"),
+        blank=True,
+        null=True,
+        max_length=16,
+    )
+
+    normalized_address = models.CharField(
+        max_length=1024,
+        unique=True,
+        editable=False,
+    )
+
+    latitude = models.FloatField(null=True, blank=True, verbose_name=_("latitude"))
+    longitude = models.FloatField(null=True, blank=True, verbose_name=_("longitude"))
+    geohash = models.CharField(
+        max_length=geo.PRECISION,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = VenueQuerySet.as_manager()
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = _("Venue")
+        verbose_name_plural = _("Venues")
+
+    def save(self, *args, **kwargs):
+        """
+        Geocodes the venue from its zip code if it has no coordinates, and
+        updates the normalized address and geohash.
+        """
+        if self.latitude is None or self.longitude is None:
+            self.geocode()
+        self.update_normalized_address()
+        self.update_geohash()
+        return super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+    def geocode(self):
+        postal_code = PostalCode.objects.filter(zip_code=self.zip_code).first()
+        if postal_code:
+            self.latitude = postal_code.latitude
+            self.longitude = postal_code.longitude
+
+    def update_normalized_address(self):
+        self.normalized_address = utils.normalize_address(
+            self.name, self.street, self.zip_code, self.city
+        )
+
+    def update_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ""
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+
+
+class Tag(models.Model):
+    """
+    Tags categorize events, for instance "Concert" or "Workshop", so the
+    calendar can be filtered by them.
+    """
+
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("name"),
+    )
+    name_da = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name=_("name (Danish)"),
+    )
+    slug = models.SlugField(
+        unique=True,
+        verbose_name=_("slug"),
+    )
+
+    class Meta:
+        ordering = ("name",)
+        verbose_name = _("Tag")
+        verbose_name_plural = _("Tags")
+
+    def save(self, *args, **kwargs):
+        return save_with_slug(
+            self, Tag, "name", "slug", partial(super().save, *args, **kwargs)
+        )
+
+    def __str__(self):
+        return self.name
+
+
 class Event(models.Model):
     """
     Recurrence:
@@ -166,6 +448,13 @@ class Event(models.Model):
         blank=True,
     )
 
+    tags = models.ManyToManyField(
+        Tag,
+        blank=True,
+        related_name="events",
+        verbose_name=_("tags"),
+    )
+
     name = models.CharField(
         max_length=255,
         verbose_name=_("name"),
@@ -177,17 +466,36 @@ class Event(models.Model):
             "A special short version of the event description, leave blank to auto-generate. Text-only, no Markdown."
         ),
     )
-    description = models.TextField(
+    description = MarkdownField(
         blank=True,
         verbose_name=_("description"),
         help_text=_(
             "Enter details, which will be displayed on the event's own page. You can use Markdown."
         ),
+        rendered_field="description_rendered",
+        validator=VALIDATOR_STANDARD,
+        use_editor=False,
+    )
+    description_rendered = RenderedMarkdownField(default="")
+    excerpt = ExcerptField(
+        max_length=utils.EXCERPT_MAX_LENGTH,
+        blank=True,
+        editable=False,
+        verbose_name=_("excerpt"),
+        help_text=_("The short description or the start of the description"),
+    )
+    # Set by the excerpt field, so it must be declared after it
+    description_preview = models.TextField(
+        default="",
+        editable=False,
+        verbose_name=_("description preview"),
+        help_text=_("The start of the rendered description, shown in listings"),
     )
 
     slug = models.SlugField(
         null=True,
         blank=True,
+        unique=True,
         verbose_name=_("slug"),
         help_text=_("The part of a URL that is displayed in dukop.dk/event/<slug>/"),
     )
@@ -236,6 +544,14 @@ class Event(models.Model):
         max_length=16,
         help_text=_("If left blank, will be copied from host group"),
     )
+    venue = models.ForeignKey(
+        Venue,
+        verbose_name=_("venue"),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="events",
+    )
 
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
@@ -273,21 +589,100 @@ class Event(models.Model):
         editable=False,
     )
 
-    objects = EventManager()
+    objects = EventQuerySet.as_manager()
+
+    # The fields a venue is resolved from
+    VENUE_ADDRESS_FIELDS = ("venue_name", "street", "zip_code", "city")
 
     class Meta:
         verbose_name = _("Event")
 
     def save(self, *args, **kwargs):
         """
-        Auto-populates the slug field if it isn't filled in.
+        Auto-populates the slug field if it isn't filled in and links the
+        venue from the address fields. The excerpt is updated by its field.
         """
-        sluggify_instance(self, Event, "name", "slug")
-        return super().save(*args, **kwargs)
+        self.update_venue()
+        return save_with_slug(
+            self, Event, "name", "slug", partial(super().save, *args, **kwargs)
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        event = super().from_db(db, field_names, values)
+        if set(cls.VENUE_ADDRESS_FIELDS) <= set(field_names):
+            # The address the venue was resolved from, see update_venue
+            event._loaded_venue_address = event.venue_address()
+        return event
+
+    def venue_address(self):
+        return utils.normalize_address(
+            *(getattr(self, field) for field in self.VENUE_ADDRESS_FIELDS)
+        )
+
+    def update_venue(self):
+        """
+        Links the venue with the same normalized address as the address
+        fields, or unlinks it when there is no venue name. It is only looked
+        up when there is no venue yet or the address has changed since the
+        event was loaded.
+        """
+        if not self.venue_name:
+            self.venue = None
+            return
+        address = self.venue_address()
+        if self.venue_id:
+            if Event.venue.is_cached(self):
+                linked_address = self.venue.normalized_address
+            else:
+                linked_address = getattr(self, "_loaded_venue_address", None)
+            if address == linked_address:
+                return
+        self.venue = Venue.objects.for_address(
+            self.venue_name, self.street, self.zip_code, self.city
+        )
+        self._loaded_venue_address = address
+
+    def update_excerpt(self):
+        """
+        Sets the excerpt from the short description, or from the rendered
+        description if there is no short description, and the preview from
+        the rendered description. The description must have been rendered.
+        """
+        self.description_preview = utils.make_preview(self.description_rendered)
+        if self.short_description.strip():
+            self.excerpt = utils.make_excerpt(self.short_description)
+        else:
+            self.excerpt = utils.make_excerpt(
+                utils.html_to_text(self.description_rendered)
+            )
 
     def __str__(self):
         return self.name
 
+    @property
+    def future_times(self):
+        """
+        Upcoming times, taken from prefetched times when they are available
+        """
+        if "times" in getattr(self, "_prefetched_objects_cache", {}):
+            now = utils.get_now()
+            return [time for time in self.times.all() if time.start >= now]
+        return self.times.future()
+
+    def other_events_at_venue(self):
+        """
+        Published events at the same venue, newest first, shown on the event
+        page
+        """
+        if not self.venue_id:
+            return Event.objects.none()
+        return (
+            Event.objects.filter(venue_id=self.venue_id, published=True)
+            .exclude(pk=self.pk)
+            .order_by("-created")
+        )
+
     def share_link(self):
         current_site = Site.objects.get_current()
         domain = current_site.domain
@@ -336,6 +731,7 @@ class EventTime(models.Model):
     class Meta:
         verbose_name = _("Event time")
         ordering = ("start", "end")
+        indexes = [models.Index(fields=["start", "end"])]
 
     def __str__(self):
         representation = display_datetime(self.start)
@@ -355,10 +751,14 @@ class EventUpdate(models.Model):
 
     event = models.ForeignKey(Event, related_name="updates", on_delete=models.CASCADE)
 
-    description = models.TextField(
+    description = MarkdownField(
         blank=True,
         verbose_name=_("description"),
+        rendered_field="description_rendered",
+        validator=VALIDATOR_STANDARD,
+        use_editor=False,
     )
+    description_rendered = RenderedMarkdownField(default="")
 
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
@@ -463,6 +863,44 @@ class OldEventSync(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     old_fk = models.PositiveIntegerField()
     is_series = models.BooleanField()
+    source_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        default="",
+        help_text=_("Hash of the imported columns of the old row"),
+    )
 
     class Meta:
         unique_together = ("old_fk", "is_series")
+
+
+class OldSyncCheckpoint(models.Model):
+    """
+    The last id imported from a table in the old database, allowing an
+    interrupted import to resume where it stopped.
+    """
+
+    table = models.CharField(max_length=255, unique=True)
+    last_old_fk = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{}: {}".format(self.table, self.last_old_fk)
+
+
+class AdminNotification(models.Model):
+    """
+    A new event waiting to be included in the next digest of an admin, see
+    the send_admin_digests command
+    """
+
+    user = models.ForeignKey(
+        "users.User", related_name="admin_notifications", on_delete=models.CASCADE
+    )
+    event = models.ForeignKey(
+        Event, related_name="admin_notifications", on_delete=models.CASCADE
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{}: {}".format(self.user, self.event)
@@ -1,11 +1,52 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Exists
+from django.db.models import OuterRef
+from django.db.models import Q
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from dukop.apps.news.models import NewsStory
 from dukop.apps.users import email
 from dukop.apps.users.models import User
+from dukop.apps.utils.http import pages_changed
 
 from . import models
 
 
+def admin_recipients(event):
+    """
+    The active admins of the event's spheres or, if it has no spheres, the
+    active superusers, in one query
+    """
+    event_spheres = models.Event.spheres.through.objects.filter(event=event.pk)
+    return (
+        User.objects.filter(is_active=True)
+        .annotate(
+            sphere_admin=Exists(event_spheres.filter(sphere__admins=OuterRef("pk"))),
+            has_spheres=Exists(event_spheres),
+        )
+        .filter(Q(sphere_admin=True) | Q(is_superuser=True, has_spheres=False))
+    )
+
+
+def notify_admins(event):
+    """
+    Admins who want digests get the event in their next digest, the others
+    get an email right away
+    """
+    recipients = list(admin_recipients(event))
+    email.AdminEventCreated.queue_for(
+        [user for user in recipients if not user.admin_digest_minutes], event
+    )
+    models.AdminNotification.objects.bulk_create(
+        models.AdminNotification(user=user, event=event)
+        for user in recipients
+        if user.admin_digest_minutes
+    )
+
+
 @receiver(post_save, sender=models.Event)
 def event_created(**kwargs):
     event = kwargs.get("instance")
@@ -14,17 +55,19 @@ def event_created(**kwargs):
     if created:
         if hasattr(event, "skip_admin_notifications"):
             return
-        admins = {}
-        for sphere in event.spheres.all():
-            for user in sphere.admins.filter(is_active=True):
-                admins[user.id] = user
-
-        if event.spheres.all().count() == 0:
-            admins = {
-                user.id: user
-                for user in User.objects.filter(is_superuser=True, is_active=True)
-            }
-
-        for user in admins.values():
-            mail = email.AdminEventCreated(user=user, context={"event": event})
-            mail.send()
+        # Spheres are added after the event is saved, so the recipients are
+        # found once the transaction is committed
+        transaction.on_commit(partial(notify_admins, event))
+
+
+# The objects that the states of conditional pages are computed from
+for model in (
+    models.Event,
+    models.EventTime,
+    models.EventImage,
+    models.EventLink,
+    models.EventUpdate,
+    NewsStory,
+):
+    post_save.connect(pages_changed, sender=model)
+    post_delete.connect(pages_changed, sender=model)
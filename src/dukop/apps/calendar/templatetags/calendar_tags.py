@@ -17,6 +17,7 @@ def get_event_times(
     featured=None,
     published=True,
     has_image=None,
+    tag=None,
 ):
 
     lookup = {"event__published": published}
@@ -40,10 +41,14 @@ def get_event_times(
         else:
             lookup["event__images"] = None
 
+    event_times = models.EventTime.objects.filter(**lookup)
+    if tag:
+        event_times = event_times.tagged(tag)
+
     return (
-        models.EventTime.objects.filter(**lookup)
-        .select_related("event")
-        .prefetch_related("event__images", "event__links")
+        event_times.select_related("event").prefetch_related(
+            "event__images", "event__links"
+        )
     ).distinct()[:max_count]
 
 
@@ -1,8 +1,12 @@
+import re
+import unicodedata
 from datetime import timedelta
+from html import unescape
 
 from django.conf import settings
 from django.utils import timezone
 from django.utils.formats import date_format
+from django.utils.text import Truncator
 from django.utils.translation import gettext as _
 
 
@@ -60,3 +64,73 @@ def display_interval(start, end=None):
 
 def populate_interval():
     pass
+
+
+def normalize_address(*parts):
+    """
+    Reduces the parts of an address to a canonical string, so that spelling
+    variations of the same venue ("Folkets Hus, 2200 København N" and
+    "folkets hus 2200 københavn n") compare equal.
+    """
+    address = " ".join(part for part in parts if part)
+    address = unicodedata.normalize("NFKC", address).casefold()
+    return re.sub(r"[\W_]+", " ", address).strip()
+
+
+EXCERPT_WORDS = 100
+EXCERPT_MAX_LENGTH = 1024
+
+
+def html_to_text(html):
+    """
+    Returns the plain text of some sanitized HTML, such as rendered Markdown
+    """
+    return unescape(re.sub(r"<[^>]*>", " ", html))
+
+
+def make_excerpt(text):
+    """
+    Returns the first words of a text with whitespace collapsed, for listings
+    of events.
+    """
+    text = " ".join(text.split())
+    return Truncator(text).words(EXCERPT_WORDS)[:EXCERPT_MAX_LENGTH]
+
+
+def make_preview(html):
+    """
+    Returns the first words of some sanitized HTML with its tags closed, for
+    listings of events.
+    """
+    return Truncator(html).words(EXCERPT_WORDS, html=True)
+
+
+# Room kept for "-<number>" when a slug is taken
+SLUG_SUFFIX_LENGTH = 8
+
+
+def free_slug(base, taken, max_length=50):
+    """
+    Returns base, or base-2, base-3... whichever is the first not in taken.
+    The base is shortened to make room for the number.
+    """
+    proposal = base
+    number = 1
+    while proposal in taken:
+        number += 1
+        suffix = "-{}".format(number)
+        proposal = base[: max_length - len(suffix)] + suffix
+    return proposal
+
+
+def slug_pattern(base, max_length=50):
+    """
+    A regular expression matching every slug that free_slug could return for
+    base, so the taken ones can be fetched with a single query
+    """
+    alternatives = [re.escape(base)]
+    for digits in range(1, SLUG_SUFFIX_LENGTH):
+        alternatives.append(
+            "{}-[0-9]{{{}}}".format(re.escape(base[: max_length - 1 - digits]), digits)
+        )
+    return "^({})$".format("|".join(alternatives))
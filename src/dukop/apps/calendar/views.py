@@ -1,21 +1,122 @@
+from datetime import timedelta
+
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import OuterRef
+from django.db.models import Subquery
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView
+from dukop.apps.utils.http import conditional_page
 from ratelimit.decorators import ratelimit
 
 from . import forms
 from . import models
+from . import utils
+
+
+def _current_hour():
+    """
+    Pages showing upcoming times change as time passes, so they are
+    considered modified at least once an hour
+    """
+    return utils.get_now().replace(minute=0, second=0, microsecond=0)
 
 
+def index_state(request):
+    """
+    The times shown on the index are within a month from today. Times and
+    images are aggregated separately, so rows aren't multiplied by a join.
+    """
+    today = utils.get_now().replace(minute=0, hour=0, second=0)
+    times = models.EventTime.objects.filter(
+        event__published=True,
+        end__gte=today,
+        start__lte=today + timedelta(days=31),
+    )
+    images = models.EventImage.objects.filter(
+        event__in=times.values("event")
+    ).aggregate(modified=Max("modified"), count=Count("id"))
+    times = times.aggregate(
+        modified=Max("modified"),
+        event_modified=Max("event__modified"),
+        count=Count("id"),
+    )
+    last_modified = max(
+        filter(
+            None,
+            [
+                _current_hour(),
+                times["modified"],
+                times["event_modified"],
+                images["modified"],
+            ],
+        )
+    )
+    return last_modified, (times["count"], images["count"])
+
+
+# Relations of an event that are shown on its page
+EVENT_RELATIONS = (
+    models.EventTime,
+    models.EventImage,
+    models.EventLink,
+    models.EventUpdate,
+)
+
+
+def _relation_state(model):
+    """
+    The latest modification and number of an event's related objects, as
+    correlated subqueries that use the index on the event
+    """
+    related = model.objects.filter(event=OuterRef("pk")).order_by().values("event")
+    return (
+        Subquery(related.annotate(modified=Max("modified")).values("modified")),
+        Subquery(related.annotate(count=Count("id")).values("count")),
+    )
+
+
+def event_state(request, pk, slug=None):
+    annotations = {}
+    for model in EVENT_RELATIONS:
+        name = model._meta.model_name
+        (
+            annotations[name + "_modified"],
+            annotations[name + "_count"],
+        ) = _relation_state(model)
+    event = (
+        models.Event.objects.visible_to(request.user)
+        .filter(pk=pk)
+        .annotate(**annotations)
+        .values("modified", *annotations)
+        .first()
+    )
+    if event is None:
+        # Not found, let the view respond
+        return None, None
+    last_modified = max(
+        filter(
+            None,
+            [_current_hour(), event["modified"]]
+            + [event[name] for name in annotations if name.endswith("_modified")],
+        )
+    )
+    return last_modified, tuple(
+        event[name] or 0 for name in annotations if name.endswith("_count")
+    )
+
+
+@conditional_page(index_state)
 def index(request):
     return render(request, "calendar/index.html")
 
 
+@method_decorator(conditional_page(event_state), name="get")
 class EventDetailView(DetailView):
 
     template_name = "calendar/event/detail.html"
@@ -23,18 +124,12 @@ class EventDetailView(DetailView):
     context_object_name = "event"
 
     def get_queryset(self):
-        qs = DetailView.get_queryset(self)
+        return models.Event.objects.visible_to(self.request.user).for_detail()
 
-        if not self.request.user or not self.request.user.is_staff:
-            if self.request.user.is_authenticated:
-                qs = qs.filter(
-                    Q(published=True)
-                    | Q(owner_user=self.request.user)
-                    | Q(owner_group__members=self.request.user)
-                )
-            else:
-                qs = qs.filter(published=True)
-        return qs
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["other_events"] = self.object.other_events_at_venue()[:5]
+        return context
 
 
 class EventCreateSuccess(EventDetailView):
@@ -86,37 +181,44 @@ class EventCreate(CreateView):
         else:
             return self.form_invalid(form)
 
+    @staticmethod
+    def formset_instances(formset, event, has_value):
+        """
+        Unsaved instances of the valid, non-deleted rows of a formset
+        """
+        instances = []
+        for form in formset:
+            if form.is_valid() and has_value(form):
+                if form.cleaned_data.get("DELETE") and form.instance.pk:
+                    continue
+                instance = form.save(commit=False)
+                instance.event = event
+                instances.append(instance)
+        return instances
+
     @transaction.atomic()
     def form_valid(self, form):
         self.object = form.save()
         event = self.object
 
-        for form in self.images_form:
-            if form.is_valid() and form.cleaned_data.get("image"):
-                if form.cleaned_data.get("DELETE") and form.instance.pk:
-                    pass
-                else:
-                    image = form.save(commit=False)
-                    image.event = event
-                    image.save()
-
-        for form in self.times_form:
-            if form.is_valid() and form.has_changed():
-                if form.cleaned_data.get("DELETE") and form.instance.pk:
-                    pass
-                else:
-                    times = form.save(commit=False)
-                    times.event = event
-                    times.save()
-
-        for form in self.links_form:
-            if form.is_valid() and form.has_changed():
-                if form.cleaned_data.get("DELETE") and form.instance.pk:
-                    pass
-                else:
-                    link = form.save(commit=False)
-                    link.event = event
-                    link.save()
+        models.EventTime.objects.bulk_create(
+            self.formset_instances(
+                self.times_form, event, lambda form: form.has_changed()
+            )
+        )
+        models.EventLink.objects.bulk_create(
+            self.formset_instances(
+                self.links_form, event, lambda form: form.has_changed()
+            )
+        )
+
+        # Images are written to storage when they are inserted, so they come
+        # last in the transaction
+        models.EventImage.objects.bulk_create(
+            self.formset_instances(
+                self.images_form, event, lambda form: form.cleaned_data.get("image")
+            )
+        )
 
         return redirect("calendar:event_create_success", pk=event.pk)
 
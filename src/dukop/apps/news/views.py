@@ -1,13 +1,25 @@
+from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
 from django.views.generic.detail import DetailView
+from dukop.apps.utils.http import conditional_page
 
 from . import models
 
 
+def story_state(request, pk):
+    modified = (
+        models.NewsStory.objects.filter(published=True, pk=pk)
+        .values_list("modified", flat=True)
+        .first()
+    )
+    return modified, None
+
+
 class AboutView(TemplateView):
     template_name = "news/about.html"
 
 
+@method_decorator(conditional_page(story_state), name="get")
 class NewsStoryView(DetailView):
     template_name = "news/story.html"
     model = models.NewsStory
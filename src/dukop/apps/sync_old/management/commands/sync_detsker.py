@@ -7,35 +7,74 @@ Currently unsupported:
 - Updating event times
 - Updating event links
 
+Each old table is imported in chunks, each in its own transaction. The last
+imported old id of each table is stored as an OldSyncCheckpoint, so a crashed
+or interrupted run resumes where it stopped. Use --restart to start over.
+A completed run resets the checkpoints.
+
+Each imported Event or EventSeries has a hash of its old columns stored on
+OldEventSync. Rows with an unchanged hash are skipped, so repeated imports
+hardly write anything.
+
+Old users are created in bulk before events. Their Devise password hashes
+are kept and upgraded when they log in, see DeviseBCryptPasswordHasher.
+
+Old categories are imported as Tags after all events, in a few set-based
+queries.
+
+Images are copied in a separate stage after each chunk of events: A
+thread pool reads the legacy files, hashes them and writes them to storage,
+after which all EventImage rows are created in bulk. Files written for a
+chunk that is rolled back are deleted again.
+
 """
+import hashlib
 import os
 import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import pytz
-from django.conf import settings
-from django.core.files.images import ImageFile
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
 from django.core.management.base import CommandError
 from django.db import transaction
 from django.template.defaultfilters import truncatewords
-from django.utils import timezone
+from django.utils.text import slugify
 from dukop.apps.calendar.models import Event
 from dukop.apps.calendar.models import EventImage
 from dukop.apps.calendar.models import EventInterval
 from dukop.apps.calendar.models import EventLink
 from dukop.apps.calendar.models import EventTime
 from dukop.apps.calendar.models import OldEventSync
+from dukop.apps.calendar.models import OldSyncCheckpoint
 from dukop.apps.calendar.models import Sphere
+from dukop.apps.calendar.models import Tag
+from dukop.apps.calendar.models import Venue
 from dukop.apps.calendar.models import Weekday
 from dukop.apps.news.models import NewsStory
 from dukop.apps.sync_old import models
+from dukop.apps.sync_old.utils import df
+from dukop.apps.sync_old.utils import ImportStats
+from dukop.apps.sync_old.utils import iter_chunks
+from dukop.apps.users.hashers import DeviseBCryptPasswordHasher
 from dukop.apps.users.models import Group
+from dukop.apps.users.models import User
 
 
 bad_fks = 0
 
+# Set by --quiet, drops the output of each row
+quiet = False
+
+
+def log(message):
+    if not quiet:
+        print(message)
+
 
 # Gets the number from weekday strings used in old db
 weekday_numbers = {
@@ -53,21 +92,6 @@ weekday_numbers = {
 event_series_map = {}
 
 
-def df(value):
-    """
-    Converts a UTC non-timezone aware field to current timezone.
-    This is because the old system somehow didn't put timezone information
-    in datetime fields.
-    """
-    return (
-        timezone.localtime(
-            value.replace(tzinfo=pytz.UTC), pytz.timezone(settings.TIME_ZONE)
-        )
-        if value
-        else None
-    )
-
-
 def create_interval(event_series, new_event):
     """
     Creates an Interval from old EventSeries object
@@ -75,7 +99,7 @@ def create_interval(event_series, new_event):
     if event_series:
         days = event_series.days.split(",")
         if len(days) > 1:
-            print("WARNING: Several weekdays in an EventSeries")
+            log("WARNING: Several weekdays in an EventSeries")
 
         interval = new_event.intervals.all().first() or EventInterval(event=new_event)
 
@@ -97,28 +121,69 @@ def create_interval(event_series, new_event):
 
 
 def ensure_location_exists(old_event):
+    """
+    Old rows may point to locations that no longer exist. When rows are read
+    with select_related("location"), such a location comes out as None while
+    location_id is still set.
+    """
     global bad_fks
     try:
-        if old_event.location and old_event.location.name:
-            pass
+        location = old_event.location
     except models.Locations.DoesNotExist:
-        print("A location had a bad FK")
+        location = None
+    if old_event.location_id and location is None:
+        log("A location had a bad FK")
         bad_fks += 1
         old_event.location = None
 
 
+# Groups of old locations that have been imported, by old location id
+groups = {}
+
+
 def create_group(old_event):
     if not old_event.location or not old_event.location.name:
         return None
-    return Group.objects.get_or_create(
-        name=old_event.location.name,
-        street=old_event.location.street_address,
-        zip_code=old_event.location.postcode[:16],
-        city=old_event.location.town,
-        description=old_event.location.description,
-        link1=old_event.location.link,
-        is_restricted=True,
-    )[0]
+    location = old_event.location
+    if location.id not in groups:
+        groups[location.id] = Group.objects.get_or_create(
+            name=location.name,
+            street=location.street_address,
+            zip_code=location.postcode[:16],
+            city=location.town,
+            description=location.description or "",
+            link1=location.link,
+            is_restricted=True,
+        )[0]
+    return groups[location.id]
+
+
+def as_float(value):
+    return float(value) if value is not None else None
+
+
+# Venues of old locations that have been imported, by old location id
+venues = {}
+
+
+def create_venue(old_event):
+    """
+    Finds or creates the Venue of the old Location. Locations that only differ
+    in spelling share the same Venue.
+    """
+    location = old_event.location
+    if not location or not location.name:
+        return None
+    if location.id not in venues:
+        venues[location.id] = Venue.objects.for_address(
+            location.name,
+            street=location.street_address,
+            zip_code=location.postcode[:16],
+            city=location.town,
+            latitude=as_float(location.latitude),
+            longitude=as_float(location.longitude),
+        )
+    return venues[location.id]
 
 
 def create_event_link(old_event, attach_to_event):
@@ -128,16 +193,66 @@ def create_event_link(old_event, attach_to_event):
     )
 
 
-def create_event(old_event, group, from_event_series=False):
+def row_hash(old_event, from_event_series=False):
+    """
+    A hash of the old columns that the import reads, stored on OldEventSync
+    to skip rows that have not changed since they were last imported.
+    """
+    values = [
+        old_event.title,
+        old_event.short_description,
+        old_event.long_description,
+        old_event.cancelled,
+        old_event.created_at,
+        old_event.published,
+        old_event.picture_file_name,
+        old_event.link,
+        old_event.start_time,
+        old_event.end_time,
+    ]
+    if from_event_series:
+        values += [
+            old_event.rule,
+            old_event.days,
+            old_event.start_date,
+            old_event.expiry,
+        ]
+    else:
+        values += [old_event.featured, old_event.event_series_id]
+    if old_event.location:
+        values += [
+            old_event.location.name,
+            old_event.location.street_address,
+            old_event.location.postcode,
+            old_event.location.town,
+            old_event.location.description,
+            old_event.location.link,
+            old_event.location.latitude,
+            old_event.location.longitude,
+        ]
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+
+
+def load_syncs(old_events, from_event_series=False):
+    """
+    Fetches the OldEventSync objects of a chunk of old events with a single
+    query, mapped by old id.
+    """
+    syncs = OldEventSync.objects.filter(
+        is_series=from_event_series,
+        old_fk__in=[old_event.id for old_event in old_events],
+    ).select_related("event")
+    return {sync.old_fk: sync for sync in syncs}
+
+
+def create_event(old_event, group, from_event_series=False, sync=None, source_hash=""):
 
     created = False
 
-    try:
-        event = OldEventSync.objects.get(
-            is_series=from_event_series, old_fk=old_event.id
-        ).event
-        print("Event found: {}".format(event.id))
-    except OldEventSync.DoesNotExist:
+    if sync:
+        event = sync.event
+        log("Event found: {}".format(event.id))
+    else:
         created = True
         event = Event()
 
@@ -162,15 +277,30 @@ def create_event(old_event, group, from_event_series=False):
         event.street = old_event.location.street_address
         event.zip_code = old_event.location.postcode[:16]
         event.city = old_event.location.town
+    event.venue = create_venue(old_event)
     event.save()
-    OldEventSync.objects.get_or_create(
-        is_series=from_event_series,
-        old_fk=old_event.id,
-        event=event,
-    )
+    save_sync(old_event, event, source_hash, from_event_series, sync)
     return created, event
 
 
+def save_sync(old_event, event, source_hash, from_event_series=False, sync=None):
+    """
+    Records which Event an old row was imported to, with the hash of its
+    columns. Events of an EventSeries are recorded with the Event of the
+    series.
+    """
+    if sync:
+        sync.source_hash = source_hash
+        sync.save(update_fields=["source_hash"])
+    else:
+        OldEventSync.objects.create(
+            is_series=from_event_series,
+            old_fk=old_event.id,
+            event=event,
+            source_hash=source_hash,
+        )
+
+
 def create_event_time(old_event, attach_to_event):
     """
     TODO: Check if it's already created?
@@ -190,21 +320,29 @@ def create_event_time(old_event, attach_to_event):
     )
 
 
-not_found_images = 0
+# Legacy images waiting to be copied by import_images(), as tuples of
+# (image_path, new_event)
+pending_images = []
 
+# IDs of events that already have an image waiting in pending_images
+events_with_pending_image = set()
+
+# Paths of legacy images that could not be found
+missing_images = []
+
+# Names of files written to storage by copy_image() that belong to a
+# transaction that has not been committed yet
+written_images = []
 
-def import_image(old_event, new_event, old_folder, from_event_series=False):
-    """
-    TODO: Just skip images that already existed
 
+def old_image_path(old_event, old_folder, from_event_series=False):
+    """
     Rails has saved images in weird subfolders.
     https://stackoverflow.com/questions/15494906/understanding-id-partition-in-paperclip
     paperclip id_partition method prepend '0' to ID of ActiveRecord instance to make it of length 9 characters.
 
     i.e 12 would be converted to 000000012, then it simply splits this string into three chunks and joins these chunks with /
     """
-
-    global not_found_images
     subfolders = str(old_event.id).zfill(9)
     subfolders = (
         old_folder,
@@ -215,40 +353,183 @@ def import_image(old_event, new_event, old_folder, from_event_series=False):
         subfolders[6:9],
         "original",
     )
-    image_path = os.path.join(
+    return os.path.join(
         *subfolders,
         old_event.picture_file_name,
     )
-    if os.path.exists(image_path):
-        image_data = ImageFile(open(image_path, "rb"))
-        event_image = EventImage(event=new_event)
-        event_image.image.save("", image_data)
-        event_image.save()
-        print("Found image {}".format(old_event.picture_file_name))
-        return event_image
-    else:
-        not_found_images += 1
-        print(
-            "Did not find {}\ntotal images not found: {}".format(
-                image_path, not_found_images
+
+
+def queue_image(old_event, new_event, old_folder, from_event_series=False):
+    """
+    Queues the image of an old Event or EventSeries for the image stage, see
+    import_images()
+    """
+    image_path = old_image_path(
+        old_event, old_folder, from_event_series=from_event_series
+    )
+    pending_images.append((image_path, new_event))
+    events_with_pending_image.add(new_event.pk)
+
+
+def copy_image(image_path, stored_names, lock):
+    """
+    Reads a legacy image, hashes it and writes it to storage. The stored name
+    is derived from the content hash, so identical files are only written
+    once.
+
+    Returns the stored name or None if the file does not exist.
+    """
+    try:
+        with open(image_path, "rb") as image_file:
+            image_data = image_file.read()
+    except FileNotFoundError:
+        return None
+
+    digest = hashlib.sha1(image_data).hexdigest()
+    ext = os.path.splitext(image_path)[1].lower()
+    name = os.path.join("uploads/events", digest + ext)
+
+    with lock:
+        if name in stored_names:
+            return name
+        stored_names.add(name)
+
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(image_data))
+        with lock:
+            written_images.append(name)
+    return name
+
+
+def discard_written_images():
+    """
+    Deletes the files written by copy_image() since the last commit, when
+    their EventImage rows are rolled back
+    """
+    for name in written_images:
+        default_storage.delete(name)
+    written_images.clear()
+
+
+def import_images(workers):
+    """
+    Copies all queued images with a pool of threads and attaches them to their
+    events with a single bulk insert. Images that are not found are added to
+    missing_images.
+    """
+    global pending_images, events_with_pending_image
+
+    stored_names = set()
+    lock = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        names = executor.map(
+            lambda pending: copy_image(pending[0], stored_names, lock),
+            pending_images,
+        )
+        event_images = []
+        for (image_path, new_event), name in zip(pending_images, names):
+            if name:
+                event_images.append(EventImage(event=new_event, image=name))
+            else:
+                missing_images.append(image_path)
+
+    EventImage.objects.bulk_create(event_images)
+
+    pending_images = []
+    events_with_pending_image = set()
+
+    return event_images
+
+
+def load_event_series_map():
+    """
+    Fills event_series_map with series imported in earlier runs, so events of
+    those series are still attached to them when an import is resumed.
+    """
+    syncs = OldEventSync.objects.filter(is_series=True).select_related("event")
+    for sync in syncs:
+        event_series_map[sync.old_fk] = sync.event
+
+
+# Ids of old users that were not imported because their email was empty or
+# already taken
+skipped_users = []
+
+
+def import_users_chunk(chunk):
+    """
+    Creates Users for a chunk of old users with a single bulk insert. Users
+    whose email is empty or already exists are skipped and recorded in
+    skipped_users.
+
+    Passwords keep their Devise hash and are upgraded to the current hasher
+    when the user logs in, so nobody has to sign up or receive a token again.
+    """
+    existing_emails = set(
+        User.objects.filter(
+            email__in=[User.objects.normalize_email(u.email) for u in chunk]
+        ).values_list("email", flat=True)
+    )
+    new_users = {}
+    for old_user in chunk:
+        email = User.objects.normalize_email(old_user.email)
+        if not email or email in existing_emails or email in new_users:
+            log("Skipping user {}".format(old_user.id))
+            skipped_users.append(old_user.id)
+            continue
+        if old_user.encrypted_password:
+            password = DeviseBCryptPasswordHasher.from_devise(
+                old_user.encrypted_password
             )
+        else:
+            password = make_password(None)
+        new_users[email] = User(
+            email=email,
+            nick=(old_user.username or "")[:60] or None,
+            password=password,
+            last_login=df(old_user.last_sign_in_at),
         )
+        log("Imported user {}".format(old_user.id))
+    # Without ignore_conflicts, a user created meanwhile fails the chunk, which
+    # is imported again when the command is resumed
+    User.objects.bulk_create(new_users.values())
+
+
+def import_event_series_chunk(chunk, import_base_dir):
+    syncs = load_syncs(chunk, from_event_series=True)
+    for series in chunk:
+        log("-----------------------------")
+        import_event_series(series, import_base_dir, sync=syncs.get(series.id))
+
+
+def import_events_chunk(chunk, import_base_dir):
+    syncs = load_syncs(chunk)
+    for event in chunk:
+        log("-----------------------------")
+        import_event(event, import_base_dir, sync=syncs.get(event.id))
 
 
-def import_event_series(series, import_base_dir):
-    global event_series_map
-    event = import_event(series, import_base_dir, from_event_series=True)
-    create_interval(series, event)
-    event_series_map[series.id] = event
+def import_event_series(series, import_base_dir, sync=None):
+    event = import_event(series, import_base_dir, from_event_series=True, sync=sync)
+    # Unchanged series are already in event_series_map
+    if event:
+        create_interval(series, event)
+        event_series_map[series.id] = event
 
 
-def import_event(event, import_base_dir, from_event_series=False):
+def import_event(event, import_base_dir, from_event_series=False, sync=None):
     """
-    Imports an Event or EventSeries
+    Imports an Event or EventSeries. Rows that have not changed since they
+    were last imported are skipped.
     """
-    global event_series_map
     ensure_location_exists(event)
 
+    source_hash = row_hash(event, from_event_series=from_event_series)
+    if sync and sync.source_hash == source_hash:
+        log("Unchanged since last import: {}".format(sync.event))
+        return None
+
     # Create a Group from the old Location
     group = create_group(event)
 
@@ -261,27 +542,35 @@ def import_event(event, import_base_dir, from_event_series=False):
         or event.event_series_id not in event_series_map
     ):
         created, new_event = create_event(
-            event, group, from_event_series=from_event_series
+            event,
+            group,
+            from_event_series=from_event_series,
+            sync=sync,
+            source_hash=source_hash,
         )
         attach_to_event = new_event
         if created and event.picture_file_name:
-            image = import_image(
+            queue_image(
                 event,
                 attach_to_event,
                 import_base_dir,
                 from_event_series=from_event_series,
             )
-            if image:
-                print(image.image.url)
         if created and event.link:
             create_event_link(event, attach_to_event)
     else:
         attach_to_event = event_series_map[event.event_series_id]
-
-        if not attach_to_event.images.exists() and event.picture_file_name:
-            # Only create image if none exist or it's a new event
-            if created or not attach_to_event.images.exists():
-                image = import_image(event, attach_to_event, import_base_dir)
+        # Without a sync, a resumed or repeated import can't tell that this
+        # old event has been imported
+        save_sync(event, attach_to_event, source_hash, sync=sync)
+
+        if (
+            event.picture_file_name
+            and attach_to_event.pk not in events_with_pending_image
+            and not attach_to_event.images.exists()
+        ):
+            # Only create image if none exist or are waiting to be copied
+            queue_image(event, attach_to_event, import_base_dir)
 
         new_event = None
 
@@ -290,15 +579,116 @@ def import_event(event, import_base_dir, from_event_series=False):
         create_event_time(event, attach_to_event)
 
     if created:
-        print("Imported new event: {}".format(new_event))
+        log("Imported new event: {}".format(new_event))
     elif new_event:
-        print("Updated existing event: {}".format(attach_to_event))
+        log("Updated existing event: {}".format(attach_to_event))
     else:
-        print("Did not create an event for old event id {}".format(event.id))
+        log("Did not create an event for old event id {}".format(event.id))
 
     return new_event
 
 
+def import_tags():
+    """
+    Imports old Categories as Tags and links them to the imported events.
+
+    The category join tables are read in full with a handful of set-based
+    queries and the links are written with bulk_create, rather than looking
+    up categories event by event. Returns the number of links read.
+    """
+    category_slugs = {}
+    existing_slugs = set(Tag.objects.values_list("slug", flat=True))
+    new_tags = {}
+    for category in models.Categories.objects.all():
+        name = category.english or category.danish
+        if not name:
+            continue
+        slug = slugify(name)[:50]
+        category_slugs[category.id] = slug
+        if slug not in existing_slugs and slug not in new_tags:
+            new_tags[slug] = Tag(name=name, name_da=category.danish or "", slug=slug)
+    Tag.objects.bulk_create(new_tags.values())
+
+    tag_ids = dict(Tag.objects.values_list("slug", "id"))
+    category_tag_ids = {
+        category_id: tag_ids[slug] for category_id, slug in category_slugs.items()
+    }
+
+    event_ids = {}
+    for old_fk, is_series, event_id in OldEventSync.objects.values_list(
+        "old_fk", "is_series", "event_id"
+    ):
+        event_ids[(is_series, old_fk)] = event_id
+
+    old_links = [
+        (False, old_fk, category_id)
+        for old_fk, category_id in models.CategoriesEvents.objects.values_list(
+            "event_id", "category_id"
+        ).iterator()
+    ]
+    for join_model in (models.CategoriesEventSeries, models.EventSeriesCategories):
+        old_links += [
+            (True, old_fk, category_id)
+            for old_fk, category_id in join_model.objects.values_list(
+                "event_series_id", "category_id"
+            ).iterator()
+        ]
+
+    EventTag = Event.tags.through
+    links = set()
+    for is_series, old_fk, category_id in old_links:
+        event_id = event_ids.get((is_series, old_fk))
+        tag_id = category_tag_ids.get(category_id)
+        if event_id and tag_id:
+            links.add((event_id, tag_id))
+
+    EventTag.objects.bulk_create(
+        [EventTag(event_id=event_id, tag_id=tag_id) for event_id, tag_id in links],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    log("Linked {} tags to events".format(len(links)))
+    return len(old_links)
+
+
+def import_news(news):
+    log("-----------------------------")
+    log("News: {}".format(news.title))
+    story, __ = NewsStory.objects.get_or_create(
+        headline=news.title,
+        short_story=truncatewords(news.body, 100),
+        text=news.body,
+        published=news.featured,
+    )
+    # Update the auto fields like this
+    NewsStory.objects.filter(pk=story.pk).update(
+        created=df(news.created_at),
+        modified=df(news.updated_at),
+    )
+
+
+def reset_state():
+    """
+    Empties the caches and reports above, which are kept between the stages
+    of a run but must not leak into the next run in the same process. Cached
+    Groups and Venues may belong to a rolled back transaction.
+    """
+    global bad_fks, quiet, event_series_map, groups, venues
+    global pending_images, events_with_pending_image, missing_images, written_images
+    global skipped_users
+
+    bad_fks = 0
+    quiet = False
+    event_series_map = {}
+    groups = {}
+    venues = {}
+    pending_images = []
+    events_with_pending_image = set()
+    missing_images = []
+    written_images = []
+    skipped_users = []
+
+
 class Command(BaseCommand):
     help = "Import stuff from old database"
 
@@ -313,49 +703,73 @@ class Command(BaseCommand):
             default=False,
             help="Dry-run: About the whole database transaction at the end",
         )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            default=False,
+            help="Ignore checkpoints from earlier runs and import everything again",
+        )
         parser.add_argument(
             "import_img_dir",
             type=str,
             help="Base where old images are found",
         )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of old rows read from the database at a time",
+        )
+        parser.add_argument(
+            "--image-workers",
+            type=int,
+            default=8,
+            help="Number of threads copying images",
+        )
+        parser.add_argument(
+            "--missing-images-report",
+            type=str,
+            default=None,
+            help="Write paths of images that were not found to this file",
+        )
+        parser.add_argument(
+            "--quiet",
+            action="store_true",
+            default=False,
+            help="Only print the summary, not each imported row",
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
-        global event_series_map
+        global quiet
+
+        reset_state()
+        quiet = options["quiet"]
+        self.stats = ImportStats()
 
         import_base_dir = options.get("import_img_dir")
+        self.chunk_size = options["chunk_size"]
+        self.restart = options["restart"]
+        self.dry = options["dry"]
 
         try:
             self.stdout.write("Starting to import")
 
-            # Sync EventSeries
-            event_series = models.EventSeries.objects.all()
-            for series in event_series:
-                self.stdout.write("-----------------------------")
-                import_event_series(series, import_base_dir)
-
-            # Sync Events
-            events = models.Events.objects.all()
-            for event in events:
-                self.stdout.write("-----------------------------")
-                import_event(event, import_base_dir)
-
-            # Sync news
-            for news in models.Posts.objects.all():
-                self.stdout.write("-----------------------------")
-                self.stdout.write("News: {}".format(news.title))
-                story, __ = NewsStory.objects.get_or_create(
-                    headline=news.title,
-                    short_story=truncatewords(news.body, 100),
-                    text=news.body,
-                    published=news.featured,
-                )
-                # Update the auto fields like this
-                NewsStory.objects.filter(pk=story.pk).update(
-                    created=df(news.created_at),
-                    modified=df(news.updated_at),
-                )
-
+            with self.stats.record_queries():
+                if self.dry:
+                    # Chunks become savepoints inside one transaction that is
+                    # rolled back at the end. Events from a rolled back chunk
+                    # would otherwise be referenced by later chunks.
+                    try:
+                        with transaction.atomic():
+                            self.import_all(import_base_dir, options)
+                            transaction.set_rollback(True)
+                    finally:
+                        discard_written_images()
+                else:
+                    self.import_all(import_base_dir, options)
+
+            self.report_stats()
+            self.report_missing_images(options.get("missing_images_report"))
             self.stdout.write("Command execution completed\n".format())
 
         except Exception as e:  # noqa
@@ -366,8 +780,121 @@ class Command(BaseCommand):
             for line in formatted_excption:
                 self.stdout.write(line, ending="")
             raise CommandError(
-                "An exception occurred. All operations aborted, database rolled back.\n"
+                "An exception occurred. The current chunk was rolled back, "
+                "run the command again to resume from the last checkpoint.\n"
             )
 
-        if options.get("dry"):
+        if self.dry:
             raise CommandError("Dry-running so aborting transactions.")
+
+    def import_all(self, import_base_dir, options):
+        load_event_series_map()
+
+        def import_images_in_chunk():
+            # Copy images and attach them to the events of the chunk
+            with self.stats.stage("images") as stage:
+                stage.rows += len(pending_images)
+                event_images = import_images(options["image_workers"])
+            log("Imported {} images".format(len(event_images)))
+
+        # Sync users
+        self.import_chunks("users", models.Users.objects.all(), import_users_chunk)
+
+        # Sync EventSeries
+        self.import_chunks(
+            "event_series",
+            models.EventSeries.objects.select_related("location"),
+            lambda chunk: import_event_series_chunk(chunk, import_base_dir),
+            after_chunk=import_images_in_chunk,
+        )
+
+        # Sync Events
+        self.import_chunks(
+            "events",
+            models.Events.objects.select_related("location"),
+            lambda chunk: import_events_chunk(chunk, import_base_dir),
+            after_chunk=import_images_in_chunk,
+        )
+
+        # Sync categories as tags
+        with self.stats.stage("tags") as stage, transaction.atomic():
+            stage.rows += import_tags()
+
+        # Sync news
+        self.import_chunks(
+            "posts",
+            models.Posts.objects.all(),
+            lambda chunk: [import_news(news) for news in chunk],
+        )
+
+        # The run completed, so the next one scans all tables again. Rows that
+        # did not change are skipped by their hash.
+        if not self.dry:
+            OldSyncCheckpoint.objects.update(last_old_fk=0)
+
+    def import_chunks(self, table, queryset, import_chunk, after_chunk=None):
+        """
+        Imports rows of an old table in chunks, each chunk in its own
+        transaction. After each chunk, the last imported old id is stored
+        as a checkpoint for the table, so an interrupted import resumes from
+        there.
+        """
+        checkpoint, __ = OldSyncCheckpoint.objects.get_or_create(table=table)
+        if self.restart:
+            checkpoint.last_old_fk = 0
+        elif checkpoint.last_old_fk:
+            self.stdout.write(
+                "Resuming {} after old id {}".format(table, checkpoint.last_old_fk)
+            )
+
+        with self.stats.stage(table) as stage:
+            for chunk in iter_chunks(
+                queryset, self.chunk_size, after_id=checkpoint.last_old_fk
+            ):
+                try:
+                    with transaction.atomic():
+                        import_chunk(chunk)
+                        stage.rows += len(chunk)
+                        if after_chunk:
+                            after_chunk()
+                        checkpoint.last_old_fk = chunk[-1].id
+                        if not self.dry:
+                            checkpoint.save(update_fields=["last_old_fk", "modified"])
+                except BaseException:
+                    # Don't leave files behind for image rows that were rolled back
+                    discard_written_images()
+                    raise
+                # A dry run is rolled back at the end, along with its images
+                if not self.dry:
+                    written_images.clear()
+
+    def report_stats(self):
+        self.stdout.write("-----------------------------")
+        for line in self.stats.summary():
+            self.stdout.write(line)
+        if bad_fks:
+            self.stdout.write(
+                self.style.WARNING("{} locations had a bad FK".format(bad_fks))
+            )
+        if skipped_users:
+            self.stdout.write(
+                self.style.WARNING(
+                    "{} users with an empty or existing email were skipped".format(
+                        len(skipped_users)
+                    )
+                )
+            )
+
+    def report_missing_images(self, report_path=None):
+        if not missing_images:
+            return
+        self.stdout.write(
+            self.style.WARNING("{} images not found".format(len(missing_images)))
+        )
+        if report_path:
+            with open(report_path, "w") as report:
+                report.write("\n".join(missing_images) + "\n")
+            self.stdout.write("Missing images written to {}".format(report_path))
+        else:
+            for image_path in missing_images:
+                self.stdout.write(image_path)
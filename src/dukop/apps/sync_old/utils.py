@@ -0,0 +1,122 @@
+import time
+from contextlib import contextmanager
+from contextlib import ExitStack
+
+import pytz
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+def df(value):
+    """
+    Converts a UTC non-timezone aware field to current timezone.
+    This is because the old system somehow didn't put timezone information
+    in datetime fields.
+    """
+    return (
+        timezone.localtime(
+            value.replace(tzinfo=pytz.UTC), pytz.timezone(settings.TIME_ZONE)
+        )
+        if value
+        else None
+    )
+
+
+def iter_chunks(queryset, chunk_size=500, after_id=0):
+    """
+    Iterates a queryset of old rows as lists of at most chunk_size objects,
+    ordered by id.
+
+    Uses keyset pagination (id > last seen id) rather than offsets or a single
+    big cursor, so memory stays flat and every chunk is an index range scan,
+    even on large legacy tables.
+    """
+    queryset = queryset.order_by("id")
+    while True:
+        chunk = list(queryset.filter(id__gt=after_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        after_id = chunk[-1].id
+
+
+class ImportStage:
+    """
+    Counters of a single import stage
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.seconds = 0.0
+        self.queries = 0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class ImportStats:
+    """
+    Collects rows, wall time and database queries per import stage.
+
+    Stages can be nested, in which case time and queries are only counted for
+    the innermost stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._active = []
+        self._started = None
+
+    def _switch(self):
+        now = time.perf_counter()
+        if self._active:
+            self._active[-1].seconds += now - self._started
+        self._started = now
+
+    @contextmanager
+    def stage(self, name):
+        stage = self.stages.setdefault(name, ImportStage(name))
+        self._switch()
+        self._active.append(stage)
+        try:
+            yield stage
+        finally:
+            self._switch()
+            self._active.pop()
+
+    def _count_query(self, execute, sql, params, many, context):
+        if self._active:
+            self._active[-1].queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def record_queries(self):
+        """
+        Counts queries on all database connections, including the old
+        database
+        """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self._count_query))
+            yield
+
+    def summary(self):
+        lines = [
+            "{:<16}{:>10}{:>10}{:>10}{:>10}".format(
+                "Stage", "Rows", "Seconds", "Rows/s", "Queries"
+            )
+        ]
+        for stage in self.stages.values():
+            lines.append(
+                "{:<16}{:>10}{:>10.2f}{:>10.1f}{:>10}".format(
+                    stage.name,
+                    stage.rows,
+                    stage.seconds,
+                    stage.rows_per_second,
+                    stage.queries,
+                )
+            )
+        return lines
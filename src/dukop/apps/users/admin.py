@@ -15,3 +15,11 @@ class GroupAdmin(admin.ModelAdmin):
 @admin.register(models.User)
 class UserAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(models.OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "email_class", "status", "attempts", "created", "sent")
+    list_filter = ("status", "email_class")
+    search_fields = ("subject", "to")
+    readonly_fields = ("created", "sent", "last_error")
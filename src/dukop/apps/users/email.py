@@ -1,8 +1,13 @@
 from django.contrib import messages
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail.message import EmailMessage
+from django.db import DatabaseError
+from django.db import transaction
 from django.template import loader
 from django.utils.translation import gettext_lazy as _
+from dukop.apps.utils.metrics import registry
+
+from .models import OutgoingEmail
 
 
 class BaseEmail(EmailMessage):
@@ -36,16 +41,34 @@ class BaseEmail(EmailMessage):
     def get_body(self):
         return loader.render_to_string(self.template, self.get_context_data())
 
+    def send(self, *args, **kwargs):
+        with registry.timer(
+            "dukop_email_send_duration_seconds", email=type(self).__name__
+        ):
+            return super().send(*args, **kwargs)
+
+    def queue(self):
+        """
+        Stores the email in the outbox in the current transaction. It is sent
+        by the send_outbox command once the transaction is committed.
+        """
+        outgoing = OutgoingEmail.from_message(self, email_class=type(self).__name__)
+        outgoing.save()
+        return outgoing
+
     def send_with_feedback(self, success_msg=None):
         if not success_msg:
             success_msg = _("Email successfully sent to {}".format(", ".join(self.to)))
         try:
-            self.send(fail_silently=False)
-            messages.success(self.request, success_msg)
-        except RuntimeError:
+            # A savepoint keeps the request's transaction usable on failure
+            with transaction.atomic():
+                self.queue()
+        except DatabaseError:
             messages.error(
                 self.request, _("Not sent, something wrong with the mail server.")
             )
+        else:
+            messages.success(self.request, success_msg)
 
 
 class UserConfirm(BaseEmail):
@@ -85,3 +108,29 @@ class AdminEventCreated(BaseEmail):
 
     def __init__(self, *args, **kwargs):
         super().__init__(None, *args, **kwargs)
+
+    @classmethod
+    def queue_for(cls, users, event):
+        """
+        Queues the notification to each of the users. The body doesn't name
+        the recipient, so it is rendered once and shared by all the emails.
+        """
+        users = list(users)
+        if not users:
+            return []
+        mail = cls(context={"event": event})
+        outgoing = []
+        for user in users:
+            row = OutgoingEmail.from_message(mail, email_class=cls.__name__)
+            row.to = [user.email]
+            outgoing.append(row)
+        return OutgoingEmail.objects.bulk_create(outgoing)
+
+
+class AdminEventDigest(BaseEmail):
+
+    template = "users/mail/admin_event_digest.txt"
+    default_subject = _("New events on Dukop")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.hashers import BCryptPasswordHasher
+
+
+class DeviseBCryptPasswordHasher(BCryptPasswordHasher):
+    """
+    Verifies the bcrypt hashes of users imported from the old site, which used
+    Devise. Devise appends an optional pepper to passwords before hashing,
+    which can be configured as DEVISE_PEPPER.
+
+    An imported hash is stored as "devise_bcrypt$" followed by the original
+    hash. This hasher is not the preferred one, so Django rehashes the
+    password when the user logs in for the first time.
+    """
+
+    algorithm = "devise_bcrypt"
+
+    def verify(self, password, encoded):
+        pepper = getattr(settings, "DEVISE_PEPPER", "")
+        return super().verify(password + pepper, encoded)
+
+    @classmethod
+    def from_devise(cls, encrypted_password):
+        """
+        Returns an encoded password for a Devise encrypted_password
+        """
+        return "{}${}".format(cls.algorithm, encrypted_password)
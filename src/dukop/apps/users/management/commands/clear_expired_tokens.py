@@ -0,0 +1,15 @@
+"""
+Removes the expired login tokens of users, like clearsessions does for
+sessions. Run it from cron, for instance every hour, so the indexes of the
+token lookup only hold the tokens that can still be used.
+"""
+from django.core.management.base import BaseCommand
+from dukop.apps.users import models
+
+
+class Command(BaseCommand):
+    help = "Remove expired login tokens"
+
+    def handle(self, *args, **options):
+        cleared = models.User.objects.clear_expired_tokens()
+        self.stdout.write(self.style.SUCCESS("Cleared {} tokens".format(cleared)))
@@ -0,0 +1,160 @@
+"""
+Sends the emails waiting in the outbox.
+
+Emails are stored as OutgoingEmail rows in the same transaction as the change
+that causes them, so a slow mail server never holds up a request. This
+command sends the due emails in batches, each batch over one connection to
+the mail server. An email that fails is retried with exponential backoff, and
+given up on after --max-attempts.
+
+Run it from cron, or with --loop as a service next to the web server. A batch
+is claimed in a short transaction, which marks its rows as sending for
+--claim-seconds, and sent after the commit, so no locks are held while
+talking to the mail server and several workers can run at once. Should a
+worker die in the middle of a batch, the rest of the batch is sent again when
+the claim runs out, so an email can arrive twice but is never lost.
+"""
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from dukop.apps.users import models
+from dukop.apps.utils.metrics import registry
+
+
+class Command(BaseCommand):
+    help = "Send the emails waiting in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of emails sent over one connection",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=8,
+            help="Give up on an email after this many failed attempts",
+        )
+        parser.add_argument(
+            "--retry-seconds",
+            type=int,
+            default=60,
+            help="Wait before the first retry, doubled after each failure",
+        )
+        parser.add_argument(
+            "--claim-seconds",
+            type=int,
+            default=600,
+            help="Send a batch again if its worker hasn't finished it by then",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and look for new emails every --interval seconds",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between looking for new emails with --loop",
+        )
+
+    def handle(self, *args, **options):
+        sent = failed = 0
+        while True:
+            batch_sent, batch_failed = self.send_batch(options)
+            sent += batch_sent
+            failed += batch_failed
+            if batch_sent + batch_failed < options["batch_size"]:
+                if not options["loop"]:
+                    break
+                registry.flush_if_due()
+                time.sleep(options["interval"])
+
+        self.stdout.write(
+            self.style.SUCCESS("Sent {} emails, {} failed".format(sent, failed))
+        )
+
+    def send_batch(self, options):
+        batch = self.claim(options)
+        if not batch:
+            return 0, 0
+        sent = self.send(batch, options)
+        self.save(batch)
+        return sent, len(batch) - sent
+
+    @transaction.atomic
+    def claim(self, options):
+        """
+        Marks the next due emails as sending, so other workers skip them
+        """
+        batch = list(
+            models.OutgoingEmail.objects.due().select_for_update(skip_locked=True)[
+                : options["batch_size"]
+            ]
+        )
+        for outgoing in batch:
+            outgoing.mark_sending(options["claim_seconds"])
+        models.OutgoingEmail.objects.bulk_update(batch, ["status", "send_after"])
+        return batch
+
+    def send(self, batch, options):
+        """
+        Sends the batch over one connection and returns the number sent
+        """
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as error:
+            # The mail server is unreachable, so none of them can be sent
+            for outgoing in batch:
+                self.failed(outgoing, error, options)
+            return 0
+
+        sent = 0
+        try:
+            for outgoing in batch:
+                sent += self.send_one(connection, outgoing, options)
+        finally:
+            connection.close()
+        return sent
+
+    def send_one(self, connection, outgoing, options):
+        try:
+            with registry.timer(
+                "dukop_email_send_duration_seconds", email=outgoing.email_class
+            ):
+                connection.send_messages([outgoing.to_message()])
+        except Exception as error:
+            self.failed(outgoing, error, options)
+            # The server may have hung up, so go on with a new connection
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                pass
+            return False
+        outgoing.mark_sent()
+        registry.inc("dukop_outbox_emails_total", result="sent")
+        return True
+
+    def failed(self, outgoing, error, options):
+        outgoing.mark_failed(error, options["max_attempts"], options["retry_seconds"])
+        if outgoing.status == models.OutgoingEmail.FAILED:
+            registry.inc("dukop_outbox_emails_total", result="failed")
+            self.stderr.write(
+                "Giving up on email {} after {} attempts: {}".format(
+                    outgoing.pk, outgoing.attempts, outgoing.last_error
+                )
+            )
+        else:
+            registry.inc("dukop_outbox_emails_total", result="retry")
+
+    def save(self, batch):
+        models.OutgoingEmail.objects.bulk_update(
+            batch, ["status", "send_after", "attempts", "last_error", "sent"]
+        )
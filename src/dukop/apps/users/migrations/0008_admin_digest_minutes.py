@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='admin_digest_minutes',
+            field=models.PositiveIntegerField(choices=[(0, 'Immediately'), (15, 'Every 15 minutes'), (60, 'Every hour'), (360, 'Every 6 hours'), (1440, 'Every day')], default=0, help_text='Receive the events created in your spheres in one summary instead of an email per event', verbose_name='new event notifications'),
+        ),
+    ]
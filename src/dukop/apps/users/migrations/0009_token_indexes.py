@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_admin_digest_minutes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='token_expiry',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='token_passphrase',
+            field=models.CharField(blank=True, help_text='One time passphrase', max_length=128, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('token_expiry__isnull', False)), fields=['token_uuid'], name='users_user_token_uuid'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('token_expiry__isnull', False)), fields=['token_expiry'], name='users_user_token_expiry'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-19 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_token_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outgoingemail',
+            name='users_outgoingemail_due',
+        ),
+        migrations.AlterField(
+            model_name='outgoingemail',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'sending'])), fields=['send_after'], name='users_outgoingemail_due'),
+        ),
+    ]
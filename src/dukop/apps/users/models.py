@@ -5,6 +5,7 @@ from datetime import timedelta
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
+from django.core.mail.message import EmailMessage
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -21,6 +22,15 @@ class UserManager(BaseUserManager):
             .exclude(token_passphrase="")
         )
 
+    def clear_expired_tokens(self):
+        """
+        Removes the expired login tokens in one UPDATE, see the
+        clear_expired_tokens command
+        """
+        return self.filter(token_expiry__lt=timezone.now()).update(
+            token_uuid=None, token_expiry=None, token_passphrase=None
+        )
+
     def create_user(self, password: str = None, **kwargs):
         user = self.model(**kwargs)
         if password:
@@ -43,6 +53,16 @@ class User(PermissionsMixin, AbstractBaseUser):
     EMAIL_FIELD = "email"
     USERNAME_FIELD = "email"
 
+    DIGEST_CHOICES = (
+        (0, _("Immediately")),
+        (15, _("Every 15 minutes")),
+        (60, _("Every hour")),
+        (360, _("Every 6 hours")),
+        (1440, _("Every day")),
+    )
+
+    TOKEN_FIELDS = ["token_uuid", "token_expiry", "token_passphrase"]
+
     objects = UserManager()
 
     nick = models.CharField(max_length=60, null=True, blank=True)
@@ -70,6 +90,16 @@ class User(PermissionsMixin, AbstractBaseUser):
         max_length=128,
     )
 
+    # For admins of spheres, see dukop.apps.calendar.signals
+    admin_digest_minutes = models.PositiveIntegerField(
+        default=0,
+        choices=DIGEST_CHOICES,
+        verbose_name=_("new event notifications"),
+        help_text=_(
+            "Receive the events created in your spheres in one summary instead of an email per event"
+        ),
+    )
+
     def __str__(self) -> str:
         """Use a useful string representation."""
         return self.get_display_name()
@@ -85,19 +115,34 @@ class User(PermissionsMixin, AbstractBaseUser):
         self.token_uuid = uuid.uuid4()
         self.token_expiry = timezone.now() + timedelta(minutes=60)
         self.token_passphrase = str(random.randint(0, 100000000)).zfill(8)
-        self.save()
+        self.save(update_fields=self.TOKEN_FIELDS)
 
     def use_token(self):
         """
         When logging in, mark a token as used
         """
         self.token_uuid = None
+        self.token_expiry = None
         self.token_passphrase = None
-        self.save()
+        self.save(update_fields=self.TOKEN_FIELDS)
 
     class Meta:
         verbose_name = _("User")
         verbose_name_plural = _("Users")
+        # Only users with a pending token are indexed, for the login lookup in
+        # token_eligible() and for clear_expired_tokens()
+        indexes = [
+            models.Index(
+                fields=["token_uuid"],
+                condition=models.Q(token_expiry__isnull=False),
+                name="users_user_token_uuid",
+            ),
+            models.Index(
+                fields=["token_expiry"],
+                condition=models.Q(token_expiry__isnull=False),
+                name="users_user_token_expiry",
+            ),
+        ]
 
 
 class Group(models.Model):
@@ -155,3 +200,123 @@ class Group(models.Model):
     def __str__(self) -> str:
         """Use a useful string representation."""
         return self.name
+
+
+class OutgoingEmailQuerySet(models.QuerySet):
+    def due(self):
+        """
+        Emails to send now, including those claimed by a worker that didn't
+        finish them in time
+        """
+        return self.filter(
+            status__in=OutgoingEmail.UNSENT, send_after__lte=timezone.now()
+        ).order_by("send_after", "id")
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting to be sent by the send_outbox command. Emails are stored
+    in the same transaction as the change that causes them, so they are only
+    sent when that change is committed, and the mail server is never
+    contacted while handling a request.
+    """
+
+    PENDING = "pending"
+    # Claimed by a send_outbox worker until send_after
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, _("pending")),
+        (SENDING, _("sending")),
+        (SENT, _("sent")),
+        (FAILED, _("failed")),
+    )
+    UNSENT = (PENDING, SENDING)
+
+    objects = OutgoingEmailQuerySet.as_manager()
+
+    email_class = models.CharField(max_length=255, blank=True)
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    # The next attempt is not made before this time
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Outgoing email")
+        verbose_name_plural = _("Outgoing emails")
+        indexes = [
+            models.Index(
+                fields=["send_after"],
+                condition=models.Q(status__in=["pending", "sending"]),
+                name="users_outgoingemail_due",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return "{} ({})".format(self.subject, ", ".join(self.to))
+
+    @classmethod
+    def from_message(cls, message, email_class=""):
+        return cls(
+            email_class=email_class,
+            subject=str(message.subject),
+            body=str(message.body),
+            from_email=message.from_email,
+            to=list(message.to),
+            cc=list(message.cc),
+            bcc=list(message.bcc),
+            reply_to=list(message.reply_to),
+            headers=dict(message.extra_headers),
+        )
+
+    def to_message(self, connection=None):
+        return EmailMessage(
+            subject=self.subject,
+            body=self.body,
+            from_email=self.from_email,
+            to=self.to,
+            cc=self.cc,
+            bcc=self.bcc,
+            reply_to=self.reply_to,
+            headers=self.headers,
+            connection=connection,
+        )
+
+    def mark_sending(self, claim_seconds):
+        self.status = self.SENDING
+        self.send_after = timezone.now() + timedelta(seconds=claim_seconds)
+
+    def mark_sent(self):
+        self.status = self.SENT
+        self.sent = timezone.now()
+        self.attempts += 1
+        self.last_error = ""
+
+    def mark_failed(self, error, max_attempts, retry_seconds):
+        """
+        Schedules the next attempt with exponential backoff, or gives up after
+        max_attempts
+        """
+        self.attempts += 1
+        self.last_error = "{}: {}".format(type(error).__name__, error)
+        if self.attempts >= max_attempts:
+            self.status = self.FAILED
+        else:
+            self.status = self.PENDING
+            self.send_after = timezone.now() + timedelta(
+                seconds=retry_seconds * 2 ** (self.attempts - 1)
+            )
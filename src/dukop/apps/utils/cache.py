@@ -0,0 +1,165 @@
+"""
+A cache backend keeping its values in a SQLite database in WAL mode.
+
+It holds the counters of django-ratelimit (RATELIMIT_USE_CACHE) and the
+validators of pages (see dukop.apps.utils.http): All processes on a host
+share the database file, so the rate limits and invalidations hold across
+gunicorn workers without a cache server. With WAL and synchronous=NORMAL,
+writes don't wait for the disk, and readers never wait for writers, so a
+lookup costs a fraction of a millisecond.
+
+Integers, like the counters, are stored as such and other values are
+pickled. The upsert in add() needs SQLite 3.24 or later.
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+# Fraction of writes that also remove expired values
+CULL_PROBABILITY = 0.01
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        # Connections can't be shared with processes forked by gunicorn
+        if getattr(self.local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def write(self, sql, key, value, timeout, *params):
+        cursor = self.connection.execute(
+            sql,
+            (key, self.dump(value), self.get_backend_timeout(timeout)) + params,
+        )
+        if random.random() < CULL_PROBABILITY:
+            self.cull()
+        return cursor.rowcount
+
+    def cull(self):
+        self.connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self._max_entries:
+            self.connection.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)",
+                (count // self._cull_frequency,),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        # Replaces the value only if it has expired
+        return bool(
+            self.write(
+                "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE "
+                "SET value = excluded.value, expires = excluded.expires "
+                "WHERE cache.expires <= ?",
+                key,
+                value,
+                timeout,
+                time.time(),
+            )
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        self.write(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            key,
+            value,
+            timeout,
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self.get_key(key, version)
+        row = self.connection.execute(
+            "SELECT value FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return default
+        return self.load(row[0])
+
+    def incr(self, key, delta=1, version=None):
+        key = self.get_key(key, version)
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self.load(row[0]) + delta
+            connection.execute(
+                "UPDATE cache SET value = ? WHERE key = ?", (self.dump(value), key)
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        cursor = self.connection.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return bool(cursor.rowcount)
+
+    def delete(self, key, version=None):
+        key = self.get_key(key, version)
+        cursor = self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return bool(cursor.rowcount)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Keep the connection open between requests, it is cheap to hold
+        pass
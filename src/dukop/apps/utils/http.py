@@ -0,0 +1,138 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import Max
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+from dukop import __version__
+from dukop.apps.news.models import NewsStory
+
+# Validators are cached in a cache shared by all processes, see CACHES
+VALIDATORS_CACHE = "validators"
+VERSION_KEY = "dukop:pages:version"
+# Changes that don't send signals, like bulk updates and new group members,
+# are seen when the cached validators expire
+VALIDATORS_TIMEOUT = 60
+
+
+def pages_changed(**kwargs):
+    """
+    Receiver of the save and delete signals of objects shown on conditional
+    pages, see dukop.apps.calendar.signals. Moving to a new version makes all
+    cached validators stale. It is done again after the commit, since
+    concurrent requests may have cached the state from before it.
+    """
+
+    def new_version():
+        caches[VALIDATORS_CACHE].set(VERSION_KEY, time.time_ns(), None)
+
+    new_version()
+    transaction.on_commit(new_version)
+
+
+def _cached_validators(request, page_state, *args, **kwargs):
+    """
+    The validators of a page from the cache, so unchanged pages are answered
+    without queries
+    """
+    cache = caches[VALIDATORS_CACHE]
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+
+    sphere = getattr(request, "sphere", None)
+    key = "dukop:pages:{}".format(
+        hashlib.md5(
+            repr(
+                (
+                    version,
+                    page_state.__module__,
+                    page_state.__qualname__,
+                    args,
+                    sorted(kwargs.items()),
+                    get_language(),
+                    request.user.pk,
+                    sphere.pk if sphere else None,
+                )
+            ).encode()
+        ).hexdigest()
+    )
+    validators = cache.get(key)
+    if validators is None:
+        validators = _validators(request, page_state, *args, **kwargs)
+        cache.set(key, validators, VALIDATORS_TIMEOUT)
+    return validators
+
+
+def _validators(request, page_state, *args, **kwargs):
+    """
+    Returns the ETag and Last-Modified of a page or (None, None) when the page
+    shouldn't be served conditionally.
+    """
+    last_modified, state = page_state(request, *args, **kwargs)
+    if last_modified is None:
+        return None, None
+
+    # The news stories in the base template are on every page
+    news = NewsStory.objects.filter(published=True).aggregate(
+        modified=Max("modified"), count=Count("id")
+    )
+    if news["modified"]:
+        last_modified = max(last_modified, news["modified"])
+
+    sphere = getattr(request, "sphere", None)
+    etag = hashlib.md5(
+        repr(
+            (
+                getattr(settings, "DUKOP_ETAG_VERSION", __version__),
+                get_language(),
+                request.user.pk,
+                sphere.pk if sphere else None,
+                last_modified.isoformat(),
+                news["count"],
+                state,
+            )
+        ).encode()
+    ).hexdigest()
+
+    # Pages differ per user, and clients that only send If-Modified-Since
+    # can't tell them apart, so logged-in users only get an ETag.
+    if request.user.is_authenticated:
+        last_modified = None
+
+    return etag, last_modified
+
+
+def conditional_page(page_state):
+    """
+    Serves a page with ETag and Last-Modified, and answers 304 Not Modified
+    without running the view when the client has the current version.
+
+    page_state(request, *args, **kwargs) is called with the view's arguments.
+    It returns the latest modification time of the objects on the page and
+    anything else the page depends on, like counts that change when objects
+    are deleted. Returning None for the time disables the validators.
+
+    The validators are cached until the objects on the pages are saved or
+    deleted, or for VALIDATORS_TIMEOUT seconds.
+    """
+
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, "dukop_validators"):
+            request.dukop_validators = _cached_validators(
+                request, page_state, *args, **kwargs
+            )
+        return request.dukop_validators
+
+    def etag(request, *args, **kwargs):
+        return validators(request, *args, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
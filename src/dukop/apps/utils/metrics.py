@@ -0,0 +1,261 @@
+"""
+A small in-process metrics registry rendered in the Prometheus text format.
+
+Each process keeps its counters and histograms in memory and writes them to
+a file of its own in DUKOP_METRICS_DIR every few seconds. The metrics view
+adds up the files of all processes, so the numbers cover every gunicorn
+worker. Like the multiprocess mode of prometheus_client, the directory
+should be emptied when the site is restarted.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+METRICS = {
+    "dukop_request_duration_seconds": (
+        HISTOGRAM,
+        "Time spent handling requests, by URL name",
+    ),
+    "dukop_db_queries_total": (COUNTER, "SQL queries run by requests, by URL name"),
+    "dukop_cache_requests_total": (
+        COUNTER,
+        "Lookups in the calendar caches, by cache and hit or miss",
+    ),
+    "dukop_thumbnail_duration_seconds": (
+        HISTOGRAM,
+        "Time spent generating thumbnails",
+    ),
+    "dukop_email_send_duration_seconds": (
+        HISTOGRAM,
+        "Time spent sending emails, by email class",
+    ),
+    "dukop_outbox_emails_total": (
+        COUNTER,
+        "Emails handled by send_outbox, by result (sent, retry or failed)",
+    ),
+    "dukop_ratelimit_limited_total": (
+        COUNTER,
+        "Requests that were over a rate limit, by URL name",
+    ),
+}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        # Bucket counts (the last is +Inf) followed by the sum and the count
+        # of observations
+        self.histograms = {}
+        # Functions called before the values are read, for values that are
+        # kept elsewhere (like the statistics of an lru_cache)
+        self.collectors = []
+        self.last_flush = 0.0
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[_key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        """
+        Sets a counter that is counted elsewhere in this process
+        """
+        with self.lock:
+            self.counters[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = _key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = [0] * (len(BUCKETS) + 3)
+            histogram = self.histograms[key]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-3] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def collector(self, function):
+        self.collectors.append(function)
+        return function
+
+    def snapshot(self):
+        for collect in self.collectors:
+            collect(self)
+        with self.lock:
+            return {
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "histograms": [
+                    [name, dict(labels), list(values)]
+                    for (name, labels), values in self.histograms.items()
+                ],
+            }
+
+    def flush(self):
+        """
+        Writes the values of this process to its file in DUKOP_METRICS_DIR
+        """
+        metrics_dir = getattr(settings, "DUKOP_METRICS_DIR", None)
+        if not metrics_dir:
+            return
+        self.last_flush = time.monotonic()
+        metrics_dir = Path(metrics_dir)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        # Write and rename so readers never see a partial file
+        fd, path = tempfile.mkstemp(dir=metrics_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path, metrics_dir / "{}.json".format(os.getpid()))
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= settings.DUKOP_METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def collect(self):
+        """
+        Returns the values of all processes added up
+        """
+        snapshots = [self.snapshot()]
+        metrics_dir = getattr(settings, "DUKOP_METRICS_DIR", None)
+        if metrics_dir and Path(metrics_dir).is_dir():
+            own_file = "{}.json".format(os.getpid())
+            for path in Path(metrics_dir).glob("*.json"):
+                if path.name == own_file:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    # Removed or replaced while reading
+                    continue
+
+        counters = defaultdict(float)
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot["counters"]:
+                counters[_key(name, labels)] += value
+            for name, labels, values in snapshot["histograms"]:
+                key = _key(name, labels)
+                if key not in histograms:
+                    histograms[key] = [0] * len(values)
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+        return counters, histograms
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text format
+        """
+        counters, histograms = self.collect()
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            if metric_type == COUNTER:
+                for (key_name, labels), value in sorted(counters.items()):
+                    if key_name == name:
+                        lines.append(
+                            "{}{} {}".format(name, _format_labels(labels), value)
+                        )
+            else:
+                for (key_name, labels), values in sorted(histograms.items()):
+                    if key_name != name:
+                        continue
+                    for bound, count in zip(BUCKETS + ("+Inf",), values):
+                        lines.append(
+                            "{}_bucket{} {}".format(
+                                name, _format_labels(labels + (("le", bound),)), count
+                            )
+                        )
+                    lines.append(
+                        "{}_sum{} {}".format(name, _format_labels(labels), values[-2])
+                    )
+                    lines.append(
+                        "{}_count{} {}".format(name, _format_labels(labels), values[-1])
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                label,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for label, value in labels
+        )
+    )
+
+
+registry = Registry()
+
+atexit.register(registry.flush)
+
+
+def metrics_middleware(get_response):
+    """
+    Records the duration, query count and rate limiting of every request
+    """
+
+    def middleware(request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else "<unresolved>"
+        registry.observe("dukop_request_duration_seconds", duration, view=view)
+        registry.inc("dukop_db_queries_total", queries, view=view)
+        if getattr(request, "limited", False):
+            registry.inc("dukop_ratelimit_limited_total", view=view)
+        registry.flush_if_due()
+
+        return response
+
+    return middleware
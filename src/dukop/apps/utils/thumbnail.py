@@ -0,0 +1,28 @@
+import threading
+
+from sorl.thumbnail.base import ThumbnailBackend
+
+from .metrics import registry
+
+
+class MetricsThumbnailBackend(ThumbnailBackend):
+    """
+    Counts thumbnail cache hits and misses and times thumbnail generation
+    """
+
+    local = threading.local()
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        self.local.created = False
+        thumbnail = super().get_thumbnail(file_, geometry_string, **options)
+        registry.inc(
+            "dukop_cache_requests_total",
+            cache="thumbnail",
+            result="miss" if self.local.created else "hit",
+        )
+        return thumbnail
+
+    def _create_thumbnail(self, *args, **kwargs):
+        self.local.created = True
+        with registry.timer("dukop_thumbnail_duration_seconds"):
+            return super()._create_thumbnail(*args, **kwargs)
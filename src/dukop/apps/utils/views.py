@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.http import Http404
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import registry
+
+
+def has_metrics_token(request):
+    token = getattr(settings, "DUKOP_METRICS_TOKEN", None)
+    if not token:
+        return False
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    return constant_time_compare(authorization, "Bearer {}".format(token))
+
+
+def metrics(request):
+    """
+    Prometheus metrics, for staff and for scrapers sending DUKOP_METRICS_TOKEN
+    as a bearer token
+    """
+    if not (request.user.is_staff or has_metrics_token(request)):
+        raise Http404()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -24,6 +24,7 @@ INSTALLED_APPS = [
     "django.contrib.sites",
     "django.contrib.staticfiles",
     "compressor",
+    "dukop.apps.analytics",
     "dukop.apps.calendar",
     "dukop.apps.news",
     "dukop.apps.users",
@@ -34,6 +35,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "dukop.apps.calendar.middleware.ProfilingMiddleware",  # Only if DUKOP_PROFILING
+    "dukop.apps.utils.metrics.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",  # Security first
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",  # Set some sensible defaults, now, before responses are modified
@@ -49,7 +52,8 @@ ROOT_URLCONF = "dukop.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates, timed by the profiling middleware
+        "BACKEND": "dukop.apps.calendar.middleware.ProfilingTemplates",
         "DIRS": [str(BASE_DIR / "templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -93,6 +97,14 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    # Users imported from the old site, rehashed when they log in
+    "dukop.apps.users.hashers.DeviseBCryptPasswordHasher",
+]
 
 AUTH_USER_MODEL = "users.User"
 
@@ -177,6 +189,10 @@ LOGGING = {
             "class": "logging.StreamHandler",
             "formatter": "django.server",
         },
+        "profiling": {
+            "level": "INFO",
+            "class": "logging.StreamHandler",
+        },
         "mail_admins": {
             "level": "ERROR",
             "filters": ["require_debug_false"],
@@ -193,9 +209,36 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "dukop.profiling": {
+            "handlers": ["profiling"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
+# Per-request profiling, see dukop.apps.calendar.middleware.ProfilingMiddleware
+DUKOP_PROFILING = False
+# Fraction of requests run with cProfile and dumped to DUKOP_PROFILING_DIR
+DUKOP_PROFILING_SAMPLE_RATE = 0.01
+DUKOP_PROFILING_DIR = str(BASE_DIR.parent.parent / "profiles")
+# Requests above these thresholds are logged as warnings with their slowest queries
+DUKOP_PROFILING_SLOW_REQUEST_MS = 500
+DUKOP_PROFILING_MAX_QUERIES = 50
+DUKOP_PROFILING_SLOWEST_QUERIES = 5
+# Send the Server-Timing header to everyone, not only to staff
+DUKOP_PROFILING_SERVER_TIMING = False
+
+# Metrics in the Prometheus text format at /metrics/
+# Each process writes its metrics to a file in this directory, so all gunicorn
+# workers are included. Empty it when restarting. None keeps the metrics of
+# each process to itself, which is only correct with a single process.
+DUKOP_METRICS_DIR = str(BASE_DIR.parent.parent / "metrics")
+DUKOP_METRICS_FLUSH_SECONDS = 5
+# Besides staff, the metrics can be read with this bearer token, set it in
+# settings.local and in the scrape config of Prometheus
+DUKOP_METRICS_TOKEN = None
+
 COMPRESS_PRECOMPILERS = (("text/x-scss", "django_libsass.SassCompiler"),)
 COMPRESS_FILTERS = {
     # CssAbsoluteFilter is incredibly slow, especially when dealing with our _flags.scss
@@ -212,6 +255,28 @@ LOGOUT_URL = reverse_lazy("users:logout")
 # See: https://github.com/jazzband/sorl-thumbnail/issues/564
 THUMBNAIL_PRESERVE_FORMAT = True
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Shared by all processes on the host, see dukop.apps.utils.cache
+    "ratelimit": {
+        "BACKEND": "dukop.apps.utils.cache.SQLiteCache",
+        "LOCATION": str(BASE_DIR.parent.parent / "ratelimit.sqlite3"),
+    },
+    # ETags of pages, see dukop.apps.utils.http
+    "validators": {
+        "BACKEND": "dukop.apps.utils.cache.SQLiteCache",
+        "LOCATION": str(BASE_DIR.parent.parent / "validators.sqlite3"),
+    },
+}
+
+# Rate limits of the login, signup and event forms
+RATELIMIT_USE_CACHE = "ratelimit"
+
+# Counts thumbnail cache hits and times thumbnail generation
+THUMBNAIL_BACKEND = "dukop.apps.utils.thumbnail.MetricsThumbnailBackend"
+
 CSP_STYLE_SRC = ["'self'", "'unsafe-inline'"]
 CSP_IMG_SRC = ["'self'", "data:"]
 
@@ -9,12 +9,11 @@ DATABASES = {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": str(BASE_DIR.parent / "test.sqlite3"),
     },
-    #    "detsker": {
-    #        "NAME": "detsker",
-    #        "ENGINE": "django.db.backends.postgresql",
-    #        "USER": "",
-    #        "PASSWORD": "",
-    #    },
+    # The old database, its tables are created by the tests that use it
+    "detsker": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": str(BASE_DIR.parent / "test-detsker.sqlite3"),
+    },
 }
 
 INSTALLED_APPS.append("dukop.apps.sync_old")
@@ -27,4 +26,13 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
 # DUKOP_BACKWARDS_DAYS = 100
 
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "ratelimit": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "validators": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+# Tests that aggregate metrics point it at a temporary directory
+DUKOP_METRICS_DIR = None
+
 THUMBNAIL_KVSTORE = "sorl.thumbnail.kvstores.dbm_kvstore.KVStore"
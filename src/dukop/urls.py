@@ -22,8 +22,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include
 from django.urls import path
+from dukop.apps.utils import views as utils_views
 
-urlpatterns = i18n_patterns(
+urlpatterns = [
+    path("metrics/", utils_views.metrics, name="metrics"),
+]
+
+urlpatterns += i18n_patterns(
     path("admin/", admin.site.urls),
     path("news/", include("dukop.apps.news.urls")),
     path("users/", include("dukop.apps.users.urls")),
@@ -0,0 +1,40 @@
+import pytest
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connections
+from dukop.apps.utils.http import VALIDATORS_CACHE
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """
+    Uploads and thumbnails are written to a temporary directory
+    """
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+
+
+@pytest.fixture(autouse=True)
+def clear_validators():
+    """
+    Ids are reused after a test is rolled back, so validators cached by an
+    earlier test could match
+    """
+    caches[VALIDATORS_CACHE].clear()
+
+
+@pytest.fixture(scope="module")
+def legacy_tables(django_db_setup, django_db_blocker):
+    """
+    Creates the unmanaged tables of the old database in the test database of
+    the detsker alias. Tests using them are Django TestCases with "detsker"
+    in their databases.
+    """
+    legacy_models = list(apps.get_app_config("sync_old").get_models())
+    with django_db_blocker.unblock():
+        with connections["detsker"].schema_editor() as editor:
+            for model in legacy_models:
+                editor.create_model(model)
+        yield
+        with connections["detsker"].schema_editor() as editor:
+            for model in reversed(legacy_models):
+                editor.delete_model(model)
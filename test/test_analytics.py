@@ -0,0 +1,53 @@
+from datetime import date
+from datetime import datetime
+from datetime import timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.test import TestCase
+from dukop.apps.analytics.models import DailyTraffic
+from dukop.apps.sync_old import models
+
+
+@pytest.mark.usefixtures("legacy_tables")
+class RollupTrafficTest(TestCase):
+    databases = {"default", "detsker"}
+
+    def rollup(self):
+        call_command("rollup_detsker_traffic", "--chunk-size", "2", stdout=StringIO())
+        return {
+            (row.date, row.landing_page, row.referring_domain, row.device_type): (
+                row.visits,
+                row.events,
+            )
+            for row in DailyTraffic.objects.all()
+        }
+
+    def test_daily_rollup(self):
+        # The old database is in UTC, 23:30 on January 1st is January 2nd in
+        # Copenhagen
+        for started_at, landing_page in (
+            (datetime(2020, 1, 1, 10, tzinfo=timezone.utc), "/events/?page=2"),
+            (datetime(2020, 1, 1, 12, tzinfo=timezone.utc), "/events/"),
+            (datetime(2020, 1, 1, 23, 30, tzinfo=timezone.utc), "/events/"),
+        ):
+            visit = models.Visits.objects.create(
+                started_at=started_at,
+                landing_page=landing_page,
+                referring_domain="Example.com",
+                device_type="Mobile",
+            )
+        models.AhoyEvents.objects.create(visit_id=visit.id, time=visit.started_at)
+        models.AhoyEvents.objects.create(
+            visit_id=None, time=datetime(2020, 1, 1, 9, tzinfo=timezone.utc)
+        )
+
+        expected = {
+            (date(2020, 1, 1), "/events/", "example.com", "Mobile"): (2, 0),
+            (date(2020, 1, 2), "/events/", "example.com", "Mobile"): (1, 1),
+            (date(2020, 1, 1), "/", "", ""): (0, 1),
+        }
+        self.assertEqual(self.rollup(), expected)
+        # Running it again replaces the rollup rather than adding to it
+        self.assertEqual(self.rollup(), expected)
@@ -0,0 +1,194 @@
+"""
+Benchmarks of the main request paths over a seeded database.
+
+Each path is requested once to warm caches and then again, and the number of
+SQL queries must stay within the budgets in benchmark_budgets.json.
+
+Wall times depend on the machine, so they are only checked when running with
+BENCHMARK_TIMING=1, which times each path over a few rounds against the
+median. Run with BENCHMARK_UPDATE=1 to write the measured numbers (with
+headroom for the wall time) back to the budgets, and say in the commit why a
+budget moved.
+"""
+import json
+import os
+import statistics
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from dukop.apps.calendar import models
+from dukop.apps.users.models import User
+
+BUDGETS_FILE = Path(__file__).parent / "benchmark_budgets.json"
+BUDGETS = json.loads(BUDGETS_FILE.read_text())
+UPDATE = bool(os.environ.get("BENCHMARK_UPDATE"))
+TIMING = UPDATE or bool(os.environ.get("BENCHMARK_TIMING"))
+
+ROUNDS = 5
+
+# Wall time budgets are written with this much headroom for slower machines
+TIME_HEADROOM = 4
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+
+def measure(name, run, before_round=None):
+    """
+    Calls run() once to warm up and then again, and checks the query count
+    of the last round against the budget. With TIMING, run() is called
+    ROUNDS times and the median wall time is checked as well.
+    """
+    if before_round:
+        before_round()
+    run()
+
+    timings = []
+    for __ in range(ROUNDS if TIMING else 1):
+        if before_round:
+            before_round()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+
+    seconds = statistics.median(timings)
+    if UPDATE:
+        BUDGETS[name] = {
+            "queries": len(queries),
+            "seconds": round(max(seconds * TIME_HEADROOM, 0.01), 3),
+        }
+        BUDGETS_FILE.write_text(json.dumps(BUDGETS, indent=2, sort_keys=True) + "\n")
+        return
+
+    budget = BUDGETS[name]
+    assert len(queries) <= budget["queries"], "{} ran {} queries:\n{}".format(
+        name,
+        len(queries),
+        "\n".join(query["sql"] for query in queries.captured_queries),
+    )
+    if TIMING:
+        assert seconds <= budget["seconds"], "{} took {:.3f}s, budget is {}s".format(
+            name, seconds, budget["seconds"]
+        )
+
+
+def get_ok(client, url):
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200
+
+    return run
+
+
+@pytest.fixture
+def seeded_db():
+    call_command(
+        "calendar_fixtures",
+        seed=1,
+        events=300,
+        days=30,
+        start_date=timezone.localdate() - timedelta(days=7),
+    )
+
+
+@pytest.fixture
+def owner(seeded_db):
+    user = User.objects.create_user(email="owner@example.com", password="secret")
+    event = models.Event.objects.order_by("id").first()
+    event.owner_user = user
+    event.published = False
+    event.save()
+    return user
+
+
+def test_calendar_index(client, seeded_db):
+    url = reverse("calendar:index")
+    measure("calendar_index", get_ok(client, url))
+
+
+def test_event_detail_anonymous(client, seeded_db):
+    event = models.Event.objects.filter(published=True).order_by("id").first()
+    url = reverse("calendar:event_detail", kwargs={"pk": event.pk})
+    measure("event_detail_anonymous", get_ok(client, url))
+
+
+def test_event_detail_not_modified(client, seeded_db):
+    event = models.Event.objects.filter(published=True).order_by("id").first()
+    url = reverse("calendar:event_detail", kwargs={"pk": event.pk})
+    etag = client.get(url)["ETag"]
+
+    def get():
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+    measure("event_detail_not_modified", get)
+
+
+def test_event_detail_owner(client, owner):
+    event = owner.owned_events.get()
+    url = reverse("calendar:event_detail", kwargs={"pk": event.pk})
+    client.force_login(owner)
+    measure("event_detail_owner", get_ok(client, url))
+
+
+def test_event_create(client, owner):
+    sphere = models.Sphere.objects.first()
+    data = {
+        "name": "Benchmark party",
+        "description": "A party",
+        "venue_name": "Holkets Fus",
+        "street": "Stengade 50",
+        "zip_code": "2200",
+        "city": "København N",
+        "spheres": [sphere.pk],
+    }
+    for prefix in ("times", "images", "links"):
+        data.update(
+            {
+                "{}-TOTAL_FORMS".format(prefix): 5,
+                "{}-INITIAL_FORMS".format(prefix): 0,
+                "{}-MIN_NUM_FORMS".format(prefix): 0,
+                "{}-MAX_NUM_FORMS".format(prefix): 5,
+            }
+        )
+    for number in range(3):
+        data["times-{}-start_0".format(number)] = "2030-01-0{}".format(number + 1)
+        data["times-{}-start_1".format(number)] = "20:00"
+        data["links-{}-link".format(number)] = "https://example.com/{}".format(number)
+
+    url = reverse("calendar:event_create")
+    client.force_login(owner)
+
+    def create():
+        response = client.post(url, data)
+        assert response.status_code == 302
+
+    measure("event_create", create)
+
+
+def test_login_token_flow(client, seeded_db):
+    user = User.objects.create_user(email="token@example.com")
+
+    def login():
+        client.post(reverse("users:login"), {"email": user.email})
+        user.refresh_from_db()
+        url = reverse("users:login_token", kwargs={"token": user.token_uuid})
+        client.get(url)
+        response = client.post(url, {"token_passphrase": user.token_passphrase})
+        assert response.status_code == 302
+
+    measure("login_token_flow", login, before_round=client.logout)
+
+
+def test_admin_event_changelist(client, seeded_db):
+    admin = User.objects.create_superuser(email="admin@example.com", password="x")
+    client.force_login(admin)
+    url = reverse("admin:calendar_event_changelist")
+    measure("admin_event_changelist", get_ok(client, url))
@@ -0,0 +1,459 @@
+from datetime import date
+from datetime import timedelta
+from pathlib import Path
+
+import markdownfield.models
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sites.models import Site
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from dukop.apps.calendar import middleware
+from dukop.apps.calendar import models
+from dukop.apps.calendar import signals
+from dukop.apps.calendar.management.commands import calendar_fixtures
+from dukop.apps.calendar.templatetags.calendar_tags import get_event_times
+from dukop.apps.news.models import NewsStory
+from dukop.apps.users.email import AdminEventDigest
+from dukop.apps.users.models import Group
+from dukop.apps.users.models import OutgoingEmail
+from dukop.apps.users.models import User
+
+
+@pytest.mark.django_db
+def test_event_times_by_tag():
+    tag = models.Tag.objects.create(name="Concert Night")
+    assert tag.slug == "concert-night"
+
+    tagged_event = models.Event.objects.create(name="Tagged")
+    tagged_event.tags.add(tag)
+    untagged_event = models.Event.objects.create(name="Untagged")
+
+    now = timezone.now()
+    for event in (tagged_event, untagged_event):
+        models.EventTime.objects.create(event=event, start=now, end=now)
+
+    assert models.EventTime.objects.tagged(tag).between(now, now).count() == 1
+    event_times = get_event_times(tag="concert-night")
+    assert [event_time.event for event_time in event_times] == [tagged_event]
+
+
+@pytest.mark.django_db
+def test_event_times_near():
+    copenhagen = models.Venue.objects.create(
+        name="Folkets Hus", latitude=55.6884, longitude=12.5584
+    )
+    aarhus = models.Venue.objects.create(
+        name="Aarhus venue", latitude=56.1629, longitude=10.2039
+    )
+    models.PostalCode.objects.create(
+        zip_code="2200", city="København N", latitude=55.6961, longitude=12.5492
+    )
+    geocoded = models.Venue.objects.create(name="Geocoded", zip_code="2200")
+    assert geocoded.geohash
+
+    nearby = models.Venue.objects.near(55.6761, 12.5683, 5)
+    assert nearby == [copenhagen, geocoded]
+    assert nearby[0].distance < 2
+
+    now = timezone.now()
+    for venue in (copenhagen, aarhus):
+        event = models.Event.objects.create(
+            name=venue.name, venue_name=venue.name, venue=venue
+        )
+        models.EventTime.objects.create(event=event, start=now, end=now)
+
+    event_times = models.EventTime.objects.near(55.6761, 12.5683, 5)
+    assert [event_time.event.venue for event_time in event_times] == [copenhagen]
+
+
+@pytest.mark.django_db
+def test_venue_for_address_deduplicates():
+    venue = models.Venue.objects.for_address(
+        "Folkets Hus", street="Stengade 50", zip_code="2200", city="København N"
+    )
+    assert venue == models.Venue.objects.for_address(
+        "FOLKETS HUS ", street="Stengade 50.", zip_code="2200", city="københavn n"
+    )
+
+    event = models.Event.objects.create(
+        name="Concert",
+        venue_name="Folkets  hus",
+        street="Stengade 50",
+        zip_code="2200",
+        city="København N",
+        published=True,
+    )
+    other_event = models.Event.objects.create(
+        name="Other concert",
+        venue_name=venue.name,
+        street=venue.street,
+        zip_code=venue.zip_code,
+        city=venue.city,
+        venue=venue,
+        published=True,
+    )
+    assert event.venue == venue
+    assert list(event.other_events_at_venue()) == [other_event]
+
+
+@pytest.mark.django_db
+def test_event_venue_follows_address(client, django_assert_num_queries):
+    event = models.Event.objects.create(
+        name="Concert", venue_name="Folkets Hus", street="Stengade 50"
+    )
+    old_venue = event.venue
+
+    event = models.Event.objects.get(pk=event.pk)
+    event.street = "Nørrebrogade 1"
+    event.save()
+    assert event.venue != old_venue
+    assert event.venue.street == "Nørrebrogade 1"
+    assert models.Venue.objects.count() == 2
+
+    # An unchanged address isn't looked up again
+    event = models.Event.objects.get(pk=event.pk)
+    event.name = "Concert (moved)"
+    with django_assert_num_queries(1):
+        event.save()
+
+    other_event = models.Event.objects.create(
+        name="Jam session", venue_name="Folkets Hus", street="Stengade 50"
+    )
+    assert other_event.venue == old_venue
+    response = client.get(
+        reverse("calendar:event_detail", kwargs={"pk": other_event.pk})
+    )
+    assert list(response.context["other_events"]) == []
+    other_event.street = "Nørrebrogade 1"
+    other_event.save()
+    response = client.get(
+        reverse("calendar:event_detail", kwargs={"pk": other_event.pk})
+    )
+    assert list(response.context["other_events"]) == [event]
+
+    # Clearing the venue name unlinks the venue
+    other_event = models.Event.objects.get(pk=other_event.pk)
+    other_event.venue_name = ""
+    other_event.save()
+    assert other_event.venue is None
+    assert models.Venue.objects.with_event_count().get(pk=old_venue.pk).event_count == 0
+
+
+@pytest.mark.django_db
+def test_calendar_fixtures_are_deterministic():
+    def generated():
+        return list(
+            models.EventTime.objects.order_by("event__slug", "start").values_list(
+                "event__slug", "start", "end"
+            )
+        )
+
+    options = {"seed": 7, "events": 50, "days": 5, "start_date": date(2030, 1, 1)}
+    call_command("calendar_fixtures", **options)
+    first_run = generated()
+    assert models.Event.objects.count() == 50
+    # bulk_create runs the pre_save of the excerpt field
+    assert not models.Event.objects.filter(excerpt="").exists()
+
+    models.Event.objects.all().delete()
+    call_command("calendar_fixtures", **options)
+    assert generated() == first_run
+
+
+@pytest.mark.django_db
+def test_calendar_fixtures_skip_taken_slugs():
+    models.Event.objects.create(name="Concert", slug="concert-1")
+    models.Event.objects.create(name="Concert", slug="concert-1-2")
+    events = [
+        models.Event(name="Concert", slug="concert-1"),
+        models.Event(name="Jam", slug="jam-2"),
+    ]
+    calendar_fixtures.free_slugs(events)
+    assert [event.slug for event in events] == ["concert-1-3", "jam-2"]
+
+
+@pytest.mark.django_db
+def test_profiling_middleware(client, settings, tmp_path, caplog, monkeypatch):
+    monkeypatch.setattr(middleware.logger, "propagate", True)
+    settings.DUKOP_PROFILING = True
+    settings.DUKOP_PROFILING_SAMPLE_RATE = 1
+    settings.DUKOP_PROFILING_DIR = str(tmp_path)
+    settings.DUKOP_PROFILING_MAX_QUERIES = 0
+
+    response = client.get("/en/")
+    assert response.status_code == 200
+    # Timings are only shown to staff
+    assert not response.has_header("Server-Timing")
+    assert "Slow request: GET /en/ 200" in caplog.text
+    assert len(list(tmp_path.glob("*-GET-en-*.prof"))) == 1
+
+    client.force_login(
+        User.objects.create_user(email="staff@example.com", is_staff=True)
+    )
+    response = client.get("/en/")
+    assert "sql;dur=" in response["Server-Timing"]
+    assert "template;dur=0.0" not in response["Server-Timing"]
+
+
+@pytest.mark.django_db
+def test_event_detail_visibility(client, django_assert_num_queries):
+    owner = User.objects.create_user(email="owner@example.com")
+    member = User.objects.create_user(email="member@example.com")
+    stranger = User.objects.create_user(email="stranger@example.com")
+    group = Group.objects.create(name="Organizers")
+    group.members.add(owner, member)
+
+    event = models.Event.objects.create(
+        name="Draft", published=False, owner_group=group
+    )
+    now = timezone.now()
+    for days in (-1, 1, 2):
+        models.EventTime.objects.create(
+            event=event,
+            start=now + timedelta(days=days),
+            end=now + timedelta(days=days),
+        )
+    models.EventLink.objects.create(event=event, link="https://example.com")
+
+    assert list(models.Event.objects.visible_to(member)) == [event]
+    assert not models.Event.objects.visible_to(stranger).exists()
+    assert not models.Event.objects.visible_to(AnonymousUser()).exists()
+
+    with django_assert_num_queries(3):
+        detail = models.Event.objects.visible_to(member).for_detail().get(pk=event.pk)
+        assert len(detail.future_times) == 2
+        assert detail.images.first() is None
+
+    url = reverse("calendar:event_detail", kwargs={"pk": event.pk})
+    client.force_login(stranger)
+    assert client.get(url).status_code == 404
+    client.force_login(member)
+    Site.objects.clear_cache()
+    with django_assert_num_queries(12):
+        assert client.get(url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_event_detail_conditional_get(client, django_assert_num_queries):
+    event = models.Event.objects.create(name="Concert", published=True)
+    url = reverse("calendar:event_detail", kwargs={"pk": event.pk})
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    assert response.has_header("Last-Modified")
+
+    # The validators are cached, only the session is loaded and saved
+    with django_assert_num_queries(4):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    NewsStory.objects.create(headline="News", published=True)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    models.EventTime.objects.create(
+        event=event, start=timezone.now(), end=timezone.now()
+    )
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+    index = client.get(reverse("calendar:index"))
+    assert (
+        client.get(
+            reverse("calendar:index"), HTTP_IF_NONE_MATCH=index["ETag"]
+        ).status_code
+        == 304
+    )
+
+
+@pytest.mark.django_db
+def test_event_description_rendered():
+    event = models.Event.objects.create(
+        name="Concert", description="**Loud** <script>alert(1)</script>"
+    )
+    assert "<strong>Loud</strong>" in event.description_rendered
+    assert "<script>" not in event.description_rendered
+
+    models.Event.objects.filter(pk=event.pk).update(description_rendered="")
+    update = models.EventUpdate.objects.create(event=event, description="*New*")
+    models.EventUpdate.objects.filter(pk=update.pk).update(description_rendered="")
+
+    call_command("backfill_event_text")
+    event.refresh_from_db()
+    update.refresh_from_db()
+    assert "<strong>Loud</strong>" in event.description_rendered
+    assert update.description_rendered == "<p><em>New</em></p>"
+
+
+@pytest.mark.django_db
+def test_event_excerpt(monkeypatch):
+    renders = []
+    render = markdownfield.models.markdown
+    monkeypatch.setattr(
+        markdownfield.models,
+        "markdown",
+        lambda **kwargs: renders.append(kwargs) or render(**kwargs),
+    )
+    event = models.Event.objects.create(
+        name="Concert", description="# Line-up\n\nBands &amp; *friends*"
+    )
+    assert event.excerpt == "Line-up Bands & friends"
+    assert event.description_preview == event.description_rendered
+    # The excerpt is taken from the description rendered by the save
+    assert len(renders) == 1
+
+    event.short_description = "Short  and\nsweet"
+    event.save()
+    assert event.excerpt == "Short and sweet"
+
+    event.description = "*word* " * 150
+    event.save()
+    # The preview is cut at a word and keeps the HTML well-formed
+    assert event.description_preview.count("<em>word") == 100
+    assert event.description_preview.endswith("<em>word…</em></p>")
+
+    models.Event.objects.filter(pk=event.pk).update(excerpt="", description_preview="")
+    call_command("backfill_event_text")
+    event.refresh_from_db()
+    assert event.excerpt == "Short and sweet"
+    assert event.description_preview.count("<em>word") == 100
+
+
+@pytest.mark.django_db
+def test_event_create_saves_formsets(client):
+    user = User.objects.create_user(email="organizer@example.com")
+    sphere = models.Sphere.get_default()
+    data = {"name": "Festival", "spheres": [sphere.pk]}
+    for prefix in ("times", "images", "links"):
+        data["{}-TOTAL_FORMS".format(prefix)] = 5
+        data["{}-INITIAL_FORMS".format(prefix)] = 0
+    for number in range(5):
+        data["times-{}-start_0".format(number)] = "2030-07-0{}".format(number + 1)
+        data["times-{}-start_1".format(number)] = "12:00"
+    data["links-0-link"] = "https://example.com"
+    photo = Path(calendar_fixtures.__file__).parent / "testphoto.jpg"
+    data["images-0-image"] = SimpleUploadedFile(
+        "photo.jpg", photo.read_bytes(), content_type="image/jpeg"
+    )
+
+    client.force_login(user)
+    response = client.post(reverse("calendar:event_create"), data)
+    assert response.status_code == 302
+
+    event = models.Event.objects.get(name="Festival")
+    assert event.times.count() == 5
+    assert event.links.get().link == "https://example.com"
+    assert event.images.get().image.name.startswith("uploads/events/")
+
+
+@pytest.mark.django_db
+def test_slugs_are_unique(django_assert_num_queries):
+    first = models.Event.objects.create(name="Concert")
+    models.Event.objects.create(name="Concert night")
+    with django_assert_num_queries(1):
+        second = models.Event(name="Concert")
+        models.sluggify_instance(second, models.Event, "name", "slug")
+    second.save()
+    third = models.Event.objects.create(name="Concert")
+    assert [first.slug, second.slug, third.slug] == [
+        "concert",
+        "concert-2",
+        "concert-3",
+    ]
+
+    long_name = "x" * 60
+    long_slugs = [models.Event.objects.create(name=long_name).slug for __ in range(3)]
+    assert long_slugs == ["x" * 50, "x" * 48 + "-2", "x" * 48 + "-3"]
+
+
+@pytest.mark.django_db
+def test_admins_notified_once_per_event(django_assert_num_queries):
+    admin = User.objects.create_user(email="admin@example.com", is_staff=True)
+    other_admin = User.objects.create_user(email="other@example.com", is_staff=True)
+    retired = User.objects.create_user(email="retired@example.com", is_active=False)
+    User.objects.create_superuser(email="super@example.com", password="x")
+    music = models.Sphere.objects.create(name="Music")
+    music.admins.add(admin, retired)
+    art = models.Sphere.objects.create(name="Art")
+    art.admins.add(admin, other_admin)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        event = models.Event.objects.create(name="Concert")
+        event.spheres.add(music, art)
+        # Nothing is looked up before the commit
+        assert not OutgoingEmail.objects.exists()
+
+    recipients = sorted(row.to[0] for row in OutgoingEmail.objects.all())
+    assert recipients == ["admin@example.com", "other@example.com"]
+    with django_assert_num_queries(1):
+        assert len(signals.admin_recipients(event)) == 2
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        models.Event.objects.create(name="Unsorted")
+    assert OutgoingEmail.objects.filter(to=["super@example.com"]).exists()
+
+
+@pytest.mark.django_db
+def test_admin_digest():
+    admin = User.objects.create_user(
+        email="admin@example.com", is_staff=True, admin_digest_minutes=60
+    )
+    sphere = models.Sphere.objects.create(name="Music")
+    sphere.admins.add(admin)
+
+    for name in ("Concert", "Jam session"):
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            event = models.Event.objects.create(name=name)
+            event.spheres.add(sphere)
+    assert not OutgoingEmail.objects.exists()
+    assert admin.admin_notifications.count() == 2
+
+    # Not due before the oldest event has waited an hour
+    call_command("send_admin_digests")
+    assert not OutgoingEmail.objects.exists()
+
+    admin.admin_notifications.update(created=timezone.now() - timedelta(hours=1))
+    call_command("send_admin_digests")
+    digest = OutgoingEmail.objects.get()
+    assert digest.to == ["admin@example.com"]
+    assert "Concert" in digest.body and "Jam session" in digest.body
+    assert not admin.admin_notifications.exists()
+
+
+@pytest.mark.django_db
+def test_admin_digest_keeps_events_created_meanwhile(monkeypatch):
+    admin = User.objects.create_user(
+        email="admin@example.com", is_staff=True, admin_digest_minutes=60
+    )
+    concert = models.Event.objects.create(name="Concert")
+    jam = models.Event.objects.create(name="Jam session")
+    models.AdminNotification.objects.create(user=admin, event=concert)
+    admin.admin_notifications.update(created=timezone.now() - timedelta(hours=1))
+
+    queue = AdminEventDigest.queue
+
+    def queue_while_event_created(self):
+        # Another request creates an event while the digest is queued
+        models.AdminNotification.objects.create(user=admin, event=jam)
+        return queue(self)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(AdminEventDigest, "queue", queue_while_event_created)
+        call_command("send_admin_digests")
+    digest = OutgoingEmail.objects.get()
+    assert "Concert" in digest.body and "Jam session" not in digest.body
+    assert list(admin.admin_notifications.values_list("event", flat=True)) == [jam.pk]
+
+    admin.admin_notifications.update(created=timezone.now() - timedelta(hours=1))
+    call_command("send_admin_digests")
+    digests = OutgoingEmail.objects.order_by("id")
+    assert len(digests) == 2
+    assert "Jam session" in digests[1].body and "Concert" not in digests[1].body
+    assert not admin.admin_notifications.exists()
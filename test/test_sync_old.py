@@ -0,0 +1,306 @@
+from datetime import date
+from datetime import datetime
+from datetime import time
+from io import StringIO
+
+import bcrypt
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.management.base import OutputWrapper
+from django.test import TestCase
+from dukop.apps.calendar.models import Event
+from dukop.apps.calendar.models import EventImage
+from dukop.apps.calendar.models import OldEventSync
+from dukop.apps.calendar.models import OldSyncCheckpoint
+from dukop.apps.calendar.models import Tag
+from dukop.apps.calendar.models import Venue
+from dukop.apps.sync_old import models
+from dukop.apps.sync_old.management.commands import sync_detsker
+from dukop.apps.sync_old.utils import ImportStats
+from dukop.apps.sync_old.utils import iter_chunks
+from dukop.apps.users.models import Group
+from dukop.apps.users.models import User
+
+
+@pytest.fixture(autouse=True)
+def import_state():
+    """
+    The functions of the command keep their state in module globals, which
+    handle() resets for each run
+    """
+    sync_detsker.reset_state()
+
+
+@pytest.fixture
+def importer():
+    command = sync_detsker.Command()
+    command.stdout = OutputWrapper(StringIO())
+    command.stats = ImportStats()
+    command.chunk_size = 2
+    command.restart = False
+    command.dry = False
+    return command
+
+
+def legacy_file(path, content=b"picture"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+@pytest.mark.django_db
+def test_images_copied_once(importer, tmp_path):
+    event = Event.objects.create(name="Concert")
+    other_event = Event.objects.create(name="Jam session")
+    legacy = tmp_path / "legacy"
+    sync_detsker.pending_images += [
+        (legacy_file(legacy / "a" / "poster.JPG"), event),
+        # Same content under a dotted directory and without an extension
+        (legacy_file(legacy / "b.old" / "poster"), other_event),
+        (str(legacy / "missing.png"), other_event),
+    ]
+
+    event_images = sync_detsker.import_images(workers=3)
+
+    names = sorted(image.image.name for image in event_images)
+    assert len(names) == 2
+    assert names[1] == names[0] + ".jpg"
+    assert sync_detsker.missing_images == [str(legacy / "missing.png")]
+    assert EventImage.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_images_of_rolled_back_chunk_deleted(importer, tmp_path):
+    event = Event.objects.create(name="Concert")
+    image_path = legacy_file(tmp_path / "legacy" / "poster.jpg")
+
+    def import_chunk(chunk):
+        sync_detsker.pending_images.append((image_path, event))
+
+    def after_chunk():
+        sync_detsker.import_images(workers=1)
+        raise RuntimeError("Chunk failed")
+
+    with pytest.raises(RuntimeError):
+        importer.import_chunks("events", Event.objects.all(), import_chunk, after_chunk)
+
+    assert not EventImage.objects.exists()
+    assert not list((tmp_path / "media").glob("uploads/events/*"))
+
+
+@pytest.mark.django_db
+def test_iter_chunks_keyset():
+    events = [Event.objects.create(name="Event {}".format(n)) for n in range(5)]
+
+    chunks = list(iter_chunks(Event.objects.order_by("-name"), 2))
+    assert [[e.pk for e in chunk] for chunk in chunks] == [
+        [events[0].pk, events[1].pk],
+        [events[2].pk, events[3].pk],
+        [events[4].pk],
+    ]
+    resumed = iter_chunks(Event.objects.all(), 2, after_id=events[2].pk)
+    assert [[e.pk for e in chunk] for chunk in resumed] == [
+        [events[3].pk, events[4].pk]
+    ]
+
+
+@pytest.mark.django_db
+def test_import_resumes_from_checkpoint(importer):
+    events = [Event.objects.create(name="Event {}".format(n)) for n in range(5)]
+    imported = []
+
+    def fail_on_third_chunk(chunk):
+        if events[4] in chunk:
+            raise RuntimeError("Connection lost")
+        imported.extend(chunk)
+
+    with pytest.raises(RuntimeError):
+        importer.import_chunks("events", Event.objects.all(), fail_on_third_chunk)
+    checkpoint = OldSyncCheckpoint.objects.get(table="events")
+    assert checkpoint.last_old_fk == events[3].pk
+
+    # Resumes after the last committed chunk
+    imported.clear()
+    importer.import_chunks("events", Event.objects.all(), imported.extend)
+    assert imported == events[4:]
+
+    importer.restart = True
+    imported.clear()
+    importer.import_chunks("events", Event.objects.all(), imported.extend)
+    assert imported == events
+
+
+def legacy_series():
+    return models.EventSeries(
+        id=1,
+        title="Weekly jam",
+        days="Monday",
+        rule="weekly",
+        start_date=date(2020, 1, 6),
+        start_time=time(20),
+        expiry=date(2020, 12, 28),
+        end_time=time(23),
+        created_at=datetime(2020, 1, 1),
+        published=True,
+    )
+
+
+def legacy_event(**kwargs):
+    kwargs.setdefault("id", 10)
+    kwargs.setdefault("title", "Concert")
+    return models.Events(
+        start_time=datetime(2020, 1, 6, 20),
+        end_time=datetime(2020, 1, 6, 23),
+        created_at=datetime(2020, 1, 1),
+        published=True,
+        **kwargs,
+    )
+
+
+@pytest.mark.django_db
+def test_unchanged_rows_skipped(importer):
+    old_event = legacy_event()
+    new_event = sync_detsker.import_event(old_event, "")
+    syncs = sync_detsker.load_syncs([old_event])
+    assert syncs[old_event.id].event == new_event
+
+    assert sync_detsker.import_event(old_event, "", sync=syncs[old_event.id]) is None
+
+    old_event.title = "Concert (moved)"
+    updated = sync_detsker.import_event(old_event, "", sync=syncs[old_event.id])
+    assert updated.pk == new_event.pk and updated.name == "Concert (moved)"
+    assert Event.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_events_of_series_are_synced(importer):
+    series = legacy_series()
+    sync_detsker.import_event_series(series, "")
+    occurrence = legacy_event(id=11, title="Weekly jam", event_series_id=series.id)
+
+    for __ in range(2):
+        syncs = sync_detsker.load_syncs([occurrence])
+        sync_detsker.import_event(occurrence, "", sync=syncs.get(occurrence.id))
+
+    series_event = sync_detsker.event_series_map[series.id]
+    assert syncs[occurrence.id].event == series_event
+    assert list(Event.objects.all()) == [series_event]
+
+
+@pytest.mark.django_db
+def test_import_stats_per_stage():
+    stats = ImportStats()
+    with stats.record_queries():
+        with stats.stage("events") as events:
+            events.rows += 2
+            Event.objects.count()
+            with stats.stage("images") as images:
+                images.rows += 1
+                Event.objects.count()
+                Event.objects.count()
+    # Queries are only counted for the innermost stage
+    assert (events.queries, images.queries) == (1, 2)
+
+    lines = stats.summary()
+    assert lines[0].split() == ["Stage", "Rows", "Seconds", "Rows/s", "Queries"]
+    assert [(line.split()[:2], line.split()[-1]) for line in lines[1:]] == [
+        (["events", "2"], "1"),
+        (["images", "1"], "2"),
+    ]
+
+
+def test_quiet_log(monkeypatch, capsys):
+    sync_detsker.log("Imported user 1")
+    monkeypatch.setattr(sync_detsker, "quiet", True)
+    sync_detsker.log("Imported user 2")
+    assert capsys.readouterr().out == "Imported user 1\n"
+
+
+@pytest.mark.usefixtures("legacy_tables")
+class LegacyImportTest(TestCase):
+    databases = {"default", "detsker"}
+
+    def test_import_and_reimport(self):
+        location = models.Locations.objects.create(
+            name="Folkets Hus",
+            street_address="Stengade 50",
+            postcode="2200",
+            town="Kbh",
+        )
+        series = legacy_series()
+        series.location = location
+        series.save()
+        occurrence = legacy_event(id=11, title="Weekly jam", event_series=series)
+        occurrence.save()
+        legacy_event(id=12, title="Concert", location=location).save()
+        music = models.Categories.objects.create(danish="Musik", english="Music")
+        models.CategoriesEvents.objects.create(event_id=12, category=music)
+        models.EventSeriesCategories.objects.create(event_series=series, category=music)
+        models.Posts.objects.create(
+            title="News",
+            body="Text",
+            featured=True,
+            created_at=datetime(2020, 1, 1),
+            updated_at=datetime(2020, 1, 1),
+        )
+
+        # A dry run first, its groups and venues must not be reused
+        with self.assertRaises(CommandError):
+            call_command(
+                "sync_detsker", "/nonexistent", "--quiet", "--dry", stdout=StringIO()
+            )
+        self.assertFalse(Event.objects.exists())
+
+        output = StringIO()
+        call_command("sync_detsker", "/nonexistent", "--quiet", stdout=output)
+
+        series_event = Event.objects.get(name="Weekly jam")
+        concert = Event.objects.get(name="Concert")
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(series_event.intervals.count(), 1)
+        self.assertEqual(concert.venue, series_event.venue)
+        self.assertTrue(Group.objects.filter(pk=concert.host_id).exists())
+        self.assertTrue(Venue.objects.filter(pk=concert.venue_id).exists())
+        self.assertEqual(
+            set(Tag.objects.get(slug="music").events.all()), {series_event, concert}
+        )
+        self.assertIn("events", output.getvalue())
+
+        # Nothing changed, so nothing is imported again
+        call_command("sync_detsker", "/nonexistent", "--quiet", stdout=StringIO())
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(OldEventSync.objects.count(), 3)
+
+    def test_import_users(self):
+        User.objects.create_user(email="taken@example.com")
+        devise_hash = bcrypt.hashpw(
+            b"old secret", bcrypt.gensalt(prefix=b"2a", rounds=4)
+        ).decode()
+        for number, email in enumerate(
+            ["organizer@example.com", "organizer@EXAMPLE.COM", "taken@example.com"]
+        ):
+            models.Users.objects.create(
+                email=email,
+                encrypted_password=devise_hash,
+                sign_in_count=0,
+                username="user{}".format(number),
+            )
+
+        output = StringIO()
+        call_command("sync_detsker", "/nonexistent", "--quiet", stdout=output)
+
+        self.assertEqual(User.objects.count(), 2)
+        organizer = User.objects.get(email="organizer@example.com")
+        self.assertEqual(organizer.nick, "user0")
+        self.assertTrue(organizer.check_password("old secret"))
+        self.assertEqual(
+            sync_detsker.skipped_users,
+            list(
+                models.Users.objects.exclude(username="user0")
+                .order_by("id")
+                .values_list("id", flat=True)
+            ),
+        )
+        self.assertIn("2 users with an empty or existing email", output.getvalue())
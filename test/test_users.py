@@ -0,0 +1,107 @@
+from datetime import timedelta
+from smtplib import SMTPException
+
+import bcrypt
+import pytest
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from dukop.apps.calendar.models import Event
+from dukop.apps.users.hashers import DeviseBCryptPasswordHasher
+from dukop.apps.users.models import OutgoingEmail
+from dukop.apps.users.models import User
+
+
+@pytest.mark.django_db
+def test_devise_password_upgraded_on_login():
+    devise_hash = bcrypt.hashpw(b"old secret", bcrypt.gensalt(prefix=b"2a", rounds=4))
+    user = User.objects.create(
+        email="organizer@example.com",
+        password=DeviseBCryptPasswordHasher.from_devise(devise_hash.decode()),
+    )
+
+    assert not user.check_password("wrong")
+    assert user.check_password("old secret")
+
+    user.refresh_from_db()
+    assert user.password.startswith("pbkdf2_sha256$")
+    assert user.check_password("old secret")
+
+
+@pytest.mark.django_db
+def test_outbox_sends_after_commit(monkeypatch):
+    User.objects.create_superuser(email="admin@example.com", password="x")
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        Event.objects.create(name="Concert")
+
+    assert mail.outbox == []
+    outgoing = OutgoingEmail.objects.get()
+    assert outgoing.to == ["admin@example.com"]
+
+    def refuse(self, messages):
+        raise SMTPException("Mailbox unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(EmailBackend, "send_messages", refuse)
+        call_command("send_outbox", retry_seconds=60)
+    outgoing.refresh_from_db()
+    assert outgoing.status == OutgoingEmail.PENDING
+    assert outgoing.attempts == 1
+    assert outgoing.send_after > timezone.now()
+    assert "Mailbox unavailable" in outgoing.last_error
+
+    # Not due yet
+    call_command("send_outbox")
+    assert mail.outbox == []
+
+    OutgoingEmail.objects.update(send_after=timezone.now())
+    call_command("send_outbox")
+    outgoing.refresh_from_db()
+    assert outgoing.status == OutgoingEmail.SENT
+    assert [message.to for message in mail.outbox] == [["admin@example.com"]]
+    assert mail.outbox[0].subject == outgoing.subject
+
+
+@pytest.mark.django_db
+def test_outbox_claims_batch_before_sending(monkeypatch):
+    outgoing = OutgoingEmail.objects.create(
+        subject="Hello", body="Hi", from_email="dukop@example.com", to=["a@b.dk"]
+    )
+    send_messages = EmailBackend.send_messages
+    seen = []
+
+    def send_claimed(self, messages):
+        # Other workers skip the batch while it is sent
+        seen.append(OutgoingEmail.objects.get().status)
+        seen.append(OutgoingEmail.objects.due().exists())
+        return send_messages(self, messages)
+
+    monkeypatch.setattr(EmailBackend, "send_messages", send_claimed)
+    call_command("send_outbox", claim_seconds=60)
+    assert seen == [OutgoingEmail.SENDING, False]
+    outgoing.refresh_from_db()
+    assert outgoing.status == OutgoingEmail.SENT
+
+    # The batch of a worker that died is sent again once the claim runs out
+    OutgoingEmail.objects.update(
+        status=OutgoingEmail.SENDING, send_after=timezone.now()
+    )
+    assert list(OutgoingEmail.objects.due()) == [outgoing]
+
+
+@pytest.mark.django_db
+def test_expired_tokens_cleared(django_assert_num_queries):
+    user = User.objects.create_user(email="organizer@example.com")
+    with django_assert_num_queries(1) as captured:
+        user.set_token()
+    assert '"email"' not in captured.captured_queries[0]["sql"]
+    assert User.objects.token_eligible().get() == user
+
+    User.objects.update(token_expiry=timezone.now() - timedelta(minutes=1))
+    assert not User.objects.token_eligible().exists()
+    call_command("clear_expired_tokens")
+    user.refresh_from_db()
+    assert user.token_uuid is None
+    assert user.token_passphrase is None
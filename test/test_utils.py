@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from dukop.apps.users.models import User
+from dukop.apps.utils.cache import SQLiteCache
+from dukop.apps.utils.metrics import registry
+
+
+@pytest.mark.django_db
+def test_metrics_aggregate_processes(client, settings, tmp_path):
+    settings.DUKOP_METRICS_DIR = str(tmp_path)
+    settings.DUKOP_METRICS_TOKEN = "secret"
+    other_worker = {
+        "counters": [
+            ["dukop_ratelimit_limited_total", {"view": "other:worker"}, 3],
+        ],
+        "histograms": [],
+    }
+    (tmp_path / "1.json").write_text(json.dumps(other_worker))
+
+    assert client.get("/en/").status_code == 200
+    response = client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert 'dukop_ratelimit_limited_total{view="other:worker"} 3.0' in text
+    assert 'dukop_request_duration_seconds_count{view="calendar:index"}' in text
+    assert 'dukop_cache_requests_total{cache="sphere",result="hit"}' in text
+
+    registry.flush()
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+@pytest.mark.django_db
+def test_metrics_need_token_or_staff(client, settings):
+    # The local address of a reverse proxy doesn't grant access
+    assert client.get("/metrics/", REMOTE_ADDR="127.0.0.1").status_code == 404
+    assert client.get("/metrics/", HTTP_AUTHORIZATION="Bearer ").status_code == 404
+
+    settings.DUKOP_METRICS_TOKEN = "secret"
+    response = client.get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong")
+    assert response.status_code == 404
+
+    client.force_login(
+        User.objects.create_user(email="staff@example.com", is_staff=True)
+    )
+    assert client.get("/metrics/").status_code == 200
+
+
+def test_sqlite_cache_shared_counters(tmp_path):
+    location = str(tmp_path / "ratelimit.sqlite3")
+    # Two instances stand in for two worker processes
+    first, second = SQLiteCache(location, {}), SQLiteCache(location, {})
+
+    assert first.add("login", 1, 60)
+    assert not second.add("login", 1, 60)
+    assert second.incr("login") == 2
+    assert first.incr("login", 3) == 5
+    assert second.get("login") == 5
+
+    first.set("expired", 1, -1)
+    assert second.get("expired") is None
+    assert second.add("expired", {"value": 2}, 60)
+    assert first.get("expired") == {"value": 2}
+    with pytest.raises(ValueError):
+        first.incr("missing")